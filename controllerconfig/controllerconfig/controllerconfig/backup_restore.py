@@ -9,22 +9,26 @@ Backup & Restore
 """
 
 from __future__ import print_function
+import collections
 import copy
 import filecmp
-import fileinput
+import gzip
 import os
-import glob
 import shutil
 import stat
 import subprocess
 import tarfile
 import tempfile
 import textwrap
+import threading
 import time
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
 from fm_api import constants as fm_constants
 from fm_api import fm_api
 from sysinv.common import constants as sysinv_constants
+from sysinv.common import utils as sysinv_utils
 
 from controllerconfig.common import log
 from controllerconfig.common import constants
@@ -64,14 +68,332 @@ kube_config = environ.get('KUBECONFIG')
 if kube_config is None:
     kube_config = '/etc/kubernetes/admin.conf'
 
+mysql_cmd = 'mysql -uroot -p"$MYSQL_ROOT_PASSWORD" '
+mysqldump_cmd = 'mysqldump -uroot -p"$MYSQL_ROOT_PASSWORD" '
+mysqldump_cmd += '--single-transaction --quick '
 
-kube_cmd_prefix = 'kubectl --kubeconfig=%s ' % kube_config
-kube_cmd_prefix += 'exec -i %s -n openstack -- bash -c ' % mariadb_pod
+# MariaDB databases that are not part of the openstack backup
+os_skip_databases = ("information_schema", "performance_schema",
+                     "mysql", "horizon", "panko", "gnocchi")
 
-mysql_prefix = '\'exec mysql -uroot -p"$MYSQL_ROOT_PASSWORD" '
-mysqldump_prefix = '\'exec mysqldump -uroot -p"$MYSQL_ROOT_PASSWORD" '
+# Buffer size used when copying file data into and out of archives. The
+# tarfile module default of 16 KiB results in an excessive number of reads
+# and writes for multi-gigabyte backups.
+TARFILE_COPY_BUFSIZE = 2 * 1024 * 1024
 
+# Maximum number of backup and restore operations run concurrently
+MAX_WORKERS = 8
 
+# Size of command output kept in memory before it is spooled to disk
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# Limits the number of command outputs spooled at once across all backup
+# steps, as each of them can hold up to SPOOL_MAX_SIZE bytes of memory
+spool_slots = threading.BoundedSemaphore(MAX_WORKERS)
+
+# Commands used to compress the backup archive and database dumps, and to
+# decompress the dumps again
+COMPRESS_CMD = ['pigz', '-6']
+DECOMPRESS_CMD = ['pigz', '-dc']
+
+
+def _tarfile_copyfileobj(src, dst, length=None, exception=IOError,
+                         bufsize=None):
+    """ Replacement for tarfile.copyfileobj using a larger buffer """
+    if length == 0:
+        return
+    if length is None:
+        shutil.copyfileobj(src, dst, TARFILE_COPY_BUFSIZE)
+        return
+
+    blocks, remainder = divmod(length, TARFILE_COPY_BUFSIZE)
+    for _ in range(blocks):
+        buf = src.read(TARFILE_COPY_BUFSIZE)
+        if len(buf) < TARFILE_COPY_BUFSIZE:
+            raise exception("unexpected end of data")
+        dst.write(buf)
+
+    if remainder != 0:
+        buf = src.read(remainder)
+        if len(buf) < remainder:
+            raise exception("unexpected end of data")
+        dst.write(buf)
+
+
+tarfile.copyfileobj = _tarfile_copyfileobj
+
+
+class _ArchiveGzipFile(gzip.GzipFile):
+    """
+    GzipFile that skips forward over data in large blocks. The standard
+    seek reads the skipped data 1 KiB at a time, which makes reading the
+    member headers of a large compressed archive very slow.
+    """
+    def seek(self, offset, whence=0):
+        # tell() is implemented in terms of seek(), so ask the base class
+        position = gzip.GzipFile.seek(self, 0, 1)
+        if whence == 1:
+            offset += position
+            whence = 0
+        if whence != 0 or offset < position:
+            return gzip.GzipFile.seek(self, offset, whence)
+
+        remaining = offset - position
+        while remaining > 0:
+            buf = self.read(min(remaining, TARFILE_COPY_BUFSIZE))
+            if not buf:
+                break
+            remaining -= len(buf)
+        return offset - remaining
+
+
+def open_archive(path):
+    """
+    Open an archive for reading. Gzip compressed archives are decompressed
+    through _ArchiveGzipFile.
+    :param path: path of the archive
+    :return: archive opened for reading
+    """
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    if not compressed:
+        return tarfile.open(path)
+
+    fileobj = _ArchiveGzipFile(path, 'rb')
+    try:
+        archive = tarfile.TarFile.taropen(path, 'r', fileobj)
+    except IOError:
+        fileobj.close()
+        raise tarfile.ReadError("not a gzip file")
+    except Exception:
+        fileobj.close()
+        raise
+    # Close the gzip file along with the archive, as tarfile.open does
+    archive._extfileobj = False
+    return archive
+
+
+def concurrent_map(func, items):
+    """
+    Apply a function to each item using a pool of threads.
+    :param func: function to apply
+    :param items: items to process
+    :return: list of results, in the same order as the items
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    pool = ThreadPool(min(MAX_WORKERS, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def spool_command_output(cmd, spool_dir=None, compress=False):
+    """
+    Run a command and spool its output to a temporary file.
+    :param cmd: command argument list
+    :param spool_dir: directory for the temporary file, if spooled to disk
+    :param compress: compress the output while it is being spooled
+    :return: temporary file holding the output, positioned at the start
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE,
+                                          dir=spool_dir)
+    procs = []
+    try:
+        procs.append((cmd, subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                            stderr=DEVNULL)))
+        if compress:
+            procs.append((COMPRESS_CMD,
+                          subprocess.Popen(COMPRESS_CMD,
+                                           stdin=procs[0][1].stdout,
+                                           stdout=subprocess.PIPE,
+                                           stderr=DEVNULL)))
+            procs[0][1].stdout.close()
+        try:
+            shutil.copyfileobj(procs[-1][1].stdout, spool,
+                               TARFILE_COPY_BUFSIZE)
+        finally:
+            procs[-1][1].stdout.close()
+            for _, proc in procs:
+                proc.wait()
+        for proc_cmd, proc in procs:
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode,
+                                                    proc_cmd)
+    except Exception:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool
+
+
+def list_directory_files(directory, suffixes):
+    """
+    List the files in a directory with one of the given suffixes.
+    :param directory: directory to list
+    :param suffixes: tuple of file name suffixes
+    :return: list of file paths, empty if the directory does not exist
+    """
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if name.endswith(suffixes)]
+
+
+def call_with_dump_input(cmd, path, stdout=None, stderr=None):
+    """
+    Run a command with a database dump as its standard input. Compressed
+    dumps are decompressed as they are read.
+    :param cmd: command argument list
+    :param path: path of the database dump
+    :param stdout: standard output of the command
+    :param stderr: standard error of the command
+    """
+    with open(path, 'rb') as dump:
+        if not path.endswith('.gz'):
+            subprocess.check_call(cmd, stdin=dump, stdout=stdout,
+                                  stderr=stderr)
+            return
+
+        decompress = subprocess.Popen(DECOMPRESS_CMD, stdin=dump,
+                                      stdout=subprocess.PIPE,
+                                      stderr=DEVNULL)
+        try:
+            rc = subprocess.call(cmd, stdin=decompress.stdout,
+                                 stdout=stdout, stderr=stderr)
+        finally:
+            decompress.stdout.close()
+            decompress.wait()
+
+    if rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd)
+    if decompress.returncode != 0:
+        raise subprocess.CalledProcessError(decompress.returncode,
+                                            DECOMPRESS_CMD)
+
+
+def archive_add_fileobj(archive, fileobj, arcname):
+    """
+    Add the contents of a file object to an archive as a regular file.
+    :param archive: archive to add to
+    :param fileobj: file object, positioned at the start of the data
+    :param arcname: name of the file in the archive
+    """
+    fileobj.seek(0, os.SEEK_END)
+    info = tarfile.TarInfo(name=arcname)
+    info.size = fileobj.tell()
+    info.mtime = time.time()
+    info.mode = 0o644
+    fileobj.seek(0)
+    archive.addfile(info, fileobj)
+
+
+def archive_add_command_outputs(archive, commands, spool_dir=None,
+                                compress=False):
+    """
+    Run commands concurrently and add their output to an archive.
+
+    The output of each command is spooled while it runs, and is added to
+    the archive and released as soon as it and the outputs before it are
+    complete. The number of outputs spooled at once is shared by all
+    callers through spool_slots.
+    :param archive: archive opened for writing
+    :param commands: list of command argument lists and names in the archive
+    :param spool_dir: directory for the temporary files, if spooled to disk
+    :param compress: compress the output while it is being spooled
+    """
+    if not commands:
+        return
+
+    pending = collections.deque()
+
+    def add_oldest():
+        result, arcname = pending.popleft()
+        try:
+            spool = result.get()
+            try:
+                archive_add_fileobj(archive, spool, arcname)
+            finally:
+                spool.close()
+        finally:
+            spool_slots.release()
+
+    pool = ThreadPool(min(MAX_WORKERS, len(commands)))
+    try:
+        for cmd, arcname in commands:
+            # Only wait for a free slot when none of the outputs is pending,
+            # so that slots are never held while waiting for others.
+            while not spool_slots.acquire(not pending):
+                add_oldest()
+            pending.append((pool.apply_async(
+                spool_command_output, (cmd,),
+                {'spool_dir': spool_dir, 'compress': compress}), arcname))
+        while pending:
+            add_oldest()
+    finally:
+        pool.terminate()
+        pool.join()
+        for _ in pending:
+            spool_slots.release()
+
+
+def archive_add_command_output(archive, cmd, arcname):
+    """
+    Add the output of a command to an archive as a regular file.
+
+    The output is written straight to the archive file as it is read, and
+    the member header is written once the size is known, so the archive
+    must be an uncompressed archive file opened for writing.
+    :param archive: archive opened for writing
+    :param cmd: command argument list
+    :param arcname: name of the file in the archive
+    """
+    info = tarfile.TarInfo(name=arcname)
+    info.mtime = time.time()
+    info.mode = 0o644
+    header_size = len(info.tobuf(archive.format, archive.encoding,
+                                 archive.errors))
+
+    # Reserve space for the header, which is filled in at the end
+    header_offset = archive.offset
+    archive.fileobj.write(tarfile.NUL * header_size)
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=DEVNULL)
+    try:
+        while True:
+            buf = proc.stdout.read(TARFILE_COPY_BUFSIZE)
+            if not buf:
+                break
+            archive.fileobj.write(buf)
+            info.size += len(buf)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    remainder = info.size % tarfile.BLOCKSIZE
+    if remainder:
+        archive.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+    end_offset = archive.fileobj.tell()
+
+    header = info.tobuf(archive.format, archive.encoding, archive.errors)
+    if len(header) != header_size:
+        raise tarfile.TarError("Header size of %s changed" % arcname)
+    archive.fileobj.seek(header_offset)
+    archive.fileobj.write(header)
+    archive.fileobj.seek(end_offset)
+
+    archive.offset = end_offset
+    archive.members.append(info)
+
+
+@sysinv_utils.memoized
 def get_backup_databases():
     """
     Retrieve database lists for backup.
@@ -112,36 +434,40 @@ def get_backup_databases():
     return BACKUP_DATABASES, BACKUP_DB_SKIP_TABLES
 
 
+def mariadb_cmd(command):
+    """
+    Build the argument list to run a command in the MariaDB server pod.
+    :param command: command line to run in the pod
+    :return: argument list for subprocess
+    """
+    return ['kubectl', '--kubeconfig=%s' % kube_config, 'exec', '-i',
+            mariadb_pod, '-n', 'openstack', '--', 'bash', '-c',
+            'exec ' + command]
+
+
+@sysinv_utils.memoized
 def get_os_backup_databases():
     """
     Retrieve openstack database lists from MariaDB for backup.
     :return: os_backup_databases
     """
 
-    skip_dbs = ("Database", "information_schema", "performance_schema",
-                "mysql", "horizon", "panko", "gnocchi")
-
     try:
-        db_cmd = kube_cmd_prefix + mysql_prefix + '-e"show databases" \''
-
-        proc = subprocess.Popen([db_cmd], shell=True,
-                                stdout=subprocess.PIPE, stderr=DEVNULL)
+        output = subprocess.check_output(
+            mariadb_cmd(mysql_cmd + '-Nse "show databases"'),
+            stderr=DEVNULL)
 
-        os_backup_dbs = set(line[:-1] for line in proc.stdout
-                            if line[:-1] not in skip_dbs)
+        return frozenset(db for db in output.splitlines()
+                         if db not in os_skip_databases)
 
-        proc.communicate()
-
-        return os_backup_dbs
-
-    except subprocess.CalledProcessError:
+    except (OSError, subprocess.CalledProcessError):
         raise BackupFail("Failed to get openstack databases from MariaDB.")
 
 
 def check_load_versions(archive, staging_dir):
     match = False
     try:
-        member = archive.getmember('etc/build.info')
+        member = get_archive_member(archive, 'etc/build.info')
         archive.extract(member, path=staging_dir)
         match = filecmp.cmp('/etc/build.info', staging_dir + '/etc/build.info')
         shutil.rmtree(staging_dir + '/etc')
@@ -182,7 +508,7 @@ def check_load_subfunctions(archive, staging_dir):
     match = False
     backup_subfunctions = None
     try:
-        member = archive.getmember('etc/platform/platform.conf')
+        member = get_archive_member(archive, 'etc/platform/platform.conf')
         archive.extract(member, path=staging_dir)
         backup_subfunctions = get_subfunctions(staging_dir +
                                                '/etc/platform/platform.conf')
@@ -206,21 +532,128 @@ def check_load_subfunctions(archive, staging_dir):
                            str(tsconfig.subfunctions)))
 
 
+def index_archive(archive):
+    """
+    Index the members of an archive by name and by top level directory.
+    The indexes are built in a single pass over the members and cached on
+    the archive.
+    :param archive: archive opened for reading
+    """
+    member_index = {}
+    prefix_index = collections.defaultdict(list)
+    for tarinfo in archive.getmembers():
+        member_index[tarinfo.name] = tarinfo
+        prefix_index[tarinfo.name.partition('/')[0]].append(tarinfo)
+    archive._member_index = member_index
+    archive._prefix_index = prefix_index
+
+
+def get_archive_member_index(archive):
+    """
+    Get the members of an archive, indexed by name.
+    The index is built on first use and cached on the archive.
+    :param archive: archive opened for reading
+    :return: dictionary of members, keyed by name
+    """
+    if getattr(archive, '_member_index', None) is None:
+        index_archive(archive)
+    return archive._member_index
+
+
+def get_archive_member(archive, name):
+    """
+    Get a member of an archive, like archive.getmember(name).
+    :param archive: archive opened for reading
+    :param name: name of the member
+    :return: the member, raises KeyError if it is not in the archive
+    """
+    return get_archive_member_index(archive)[name]
+
+
 def file_exists_in_archive(archive, file_path):
     """ Check if file exists in archive """
-    try:
-        archive.getmember(file_path)
+    if file_path in get_archive_member_index(archive):
         return True
 
-    except KeyError:
-        LOG.info("File %s is not in archive." % file_path)
-        return False
+    LOG.info("File %s is not in archive." % file_path)
+    return False
+
+
+def get_archive_prefix_index(archive):
+    """
+    Get the members of an archive, indexed by their top level directory.
+    The index is built on first use and cached on the archive.
+    :param archive: archive opened for reading
+    :return: dictionary of lists of members, keyed by top level directory
+    """
+    if getattr(archive, '_prefix_index', None) is None:
+        index_archive(archive)
+    return archive._prefix_index
 
 
 def filter_directory(archive, directory):
-    for tarinfo in archive:
-        if tarinfo.name.split('/')[0] == directory:
-            yield tarinfo
+    return get_archive_prefix_index(archive).get(directory, [])
+
+
+def extract_directory(archive, directory, dest_dir):
+    """
+    Extract a top level directory of an archive as another directory.
+
+    The directory is extracted with its archived name next to dest_dir and
+    then renamed, rather than renaming each of its members.
+    :param archive: archive to extract from
+    :param directory: name of the directory in the archive
+    :param dest_dir: path to extract the directory to, which must not exist
+    """
+    parent_dir = os.path.dirname(dest_dir)
+    utils.create_directory(parent_dir)
+
+    temp_dir = tempfile.mkdtemp(dir=parent_dir)
+    try:
+        archive.extractall(path=temp_dir,
+                           members=filter_directory(archive, directory))
+        extracted_dir = os.path.join(temp_dir, directory)
+        if os.path.isdir(extracted_dir):
+            os.rename(extracted_dir, dest_dir)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def archive_add_directory(archive, directory, arcname):
+    """
+    Add a directory tree to an archive using the system tar utility.
+
+    The tree is serialized by tar and the resulting stream is copied into
+    the archive without its end-of-archive marker, so the members appear as
+    if they had been added with archive.add(directory, arcname=arcname).
+    :param archive: archive opened for writing
+    :param directory: directory to add
+    :param arcname: name of the directory in the archive
+    """
+    # A blocking factor of 1 ensures the stream is terminated by exactly
+    # two zero blocks, without any additional record padding. Symlink
+    # targets are excluded from the name transformation.
+    eof_size = tarfile.BLOCKSIZE * 2
+    proc = subprocess.Popen(['tar', '--blocking-factor=1',
+                             '--transform=s,^\\.,%s,S' % arcname,
+                             '-C', directory, '-cf', '-', '.'],
+                            stdout=subprocess.PIPE, stderr=DEVNULL)
+    tail = b''
+    while True:
+        buf = proc.stdout.read(TARFILE_COPY_BUFSIZE)
+        if not buf:
+            break
+        buf = tail + buf
+        tail = buf[-eof_size:]
+        buf = buf[:-eof_size]
+        archive.fileobj.write(buf)
+        archive.offset += len(buf)
+    proc.stdout.close()
+
+    # tar returns 1 when files changed while they were being read, which
+    # is expected for a live system.
+    if proc.wait() > 1 or tail != tarfile.NUL * eof_size:
+        raise subprocess.CalledProcessError(proc.returncode, 'tar')
 
 
 def backup_etc_size():
@@ -236,9 +669,9 @@ def backup_etc_size():
 def backup_etc(archive):
     """ Backup etc """
     try:
-        archive.add('/etc', arcname='etc')
+        archive_add_directory(archive, '/etc', 'etc')
 
-    except tarfile.TarError:
+    except (subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup etc.")
         raise BackupFail("Failed to backup etc")
 
@@ -247,7 +680,7 @@ def restore_etc_file(archive, dest_dir, etc_file):
     """ Restore etc file """
     try:
         # Change the name of this file to remove the leading path
-        member = archive.getmember('etc/' + etc_file)
+        member = get_archive_member(archive, 'etc/' + etc_file)
         # Copy the member to avoid changing the name for future operations on
         # this member.
         temp_member = copy.copy(member)
@@ -263,9 +696,8 @@ def restore_etc_ssl_dir(archive, configpath=constants.CONFIG_WORKDIR):
     """ Restore the etc SSL dir """
 
     def filter_etc_ssl_private(members):
-        for tarinfo in members:
-            if 'etc/ssl/private' in tarinfo.name:
-                yield tarinfo
+        return [tarinfo for tarinfo in members
+                if tarinfo.name.startswith('etc/ssl/private')]
 
     if file_exists_in_archive(archive, 'config/server-cert.pem'):
         restore_config_file(
@@ -278,7 +710,33 @@ def restore_etc_ssl_dir(archive, configpath=constants.CONFIG_WORKDIR):
         # will need to be reconfigured once duplex controller (if any)
         # is restored.
         archive.extractall(path='/',
-                           members=filter_etc_ssl_private(archive))
+                           members=filter_etc_ssl_private(
+                               filter_directory(archive, 'etc')))
+
+
+def copy_directory_contents(src_dir, dest_dir):
+    """
+    Copy the contents of a directory into another directory, preserving
+    symlinks, ownership, permissions and times (equivalent to cp -Rp).
+    :param src_dir: directory to copy from
+    :param dest_dir: existing directory to copy to
+    """
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        dest = os.path.join(dest_dir, name)
+        src_stat = os.lstat(src)
+        if stat.S_ISLNK(src_stat.st_mode):
+            if os.path.lexists(dest):
+                os.remove(dest)
+            os.symlink(os.readlink(src), dest)
+        elif stat.S_ISDIR(src_stat.st_mode):
+            if not os.path.isdir(dest):
+                os.mkdir(dest)
+            copy_directory_contents(src, dest)
+            shutil.copystat(src, dest)
+        else:
+            shutil.copy2(src, dest)
+        os.lchown(dest, src_stat.st_uid, src_stat.st_gid)
 
 
 def restore_ceph_external_config_files(archive, staging_dir):
@@ -286,11 +744,11 @@ def restore_ceph_external_config_files(archive, staging_dir):
     if file_exists_in_archive(archive, "config/ceph-config"):
         restore_config_dir(archive, staging_dir, 'ceph-config', ceph_permdir)
 
-        # Copy the file to /etc/ceph.
-        # There might be no files to copy, so don't check the return code.
-        cp_command = ('cp -Rp ' + os.path.join(ceph_permdir, '*') +
-                      ' /etc/ceph/')
-        subprocess.call(cp_command, shell=True)
+        # Copy the files to /etc/ceph.
+        try:
+            copy_directory_contents(ceph_permdir, '/etc/ceph')
+        except (IOError, OSError, shutil.Error) as e:
+            LOG.warning("Failed to copy ceph-config files: %s" % e)
 
 
 def backup_config_size(config_permdir):
@@ -308,9 +766,9 @@ def backup_config(archive, config_permdir):
     try:
         # The config dir is versioned, but we're only grabbing the current
         # release
-        archive.add(config_permdir, arcname='config')
+        archive_add_directory(archive, config_permdir, 'config')
 
-    except tarfile.TarError:
+    except (subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup config.")
         raise BackupFail("Failed to backup configuration")
 
@@ -319,7 +777,7 @@ def restore_config_file(archive, dest_dir, config_file):
     """ Restore configuration file """
     try:
         # Change the name of this file to remove the leading path
-        member = archive.getmember('config/' + config_file)
+        member = get_archive_member(archive, 'config/' + config_file)
         # Copy the member to avoid changing the name for future operations on
         # this member.
         temp_member = copy.copy(member)
@@ -334,8 +792,9 @@ def restore_config_file(archive, dest_dir, config_file):
 def restore_configuration(archive, staging_dir):
     """ Restore configuration """
     try:
-        os.makedirs(constants.CONFIG_WORKDIR, stat.S_IRWXU | stat.S_IRGRP |
-                    stat.S_IXGRP | stat.S_IROTH | stat.S_IXOTH)
+        utils.create_directory(constants.CONFIG_WORKDIR,
+                               stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP |
+                               stat.S_IROTH | stat.S_IXOTH)
     except OSError:
         LOG.error("Failed to create config directory: %s",
                   constants.CONFIG_WORKDIR)
@@ -355,23 +814,26 @@ def restore_configuration(archive, staging_dir):
     shutil.copyfile(os.path.join(staging_dir, 'platform.conf'),
                     temp_platform_conf_file)
     install_uuid = utils.get_install_uuid()
-    for line in fileinput.FileInput(temp_platform_conf_file, inplace=1):
+    with open(temp_platform_conf_file) as f:
+        lines = f.readlines()
+    platform_conf = []
+    for line in lines:
         if line.startswith("INSTALL_UUID="):
             # The INSTALL_UUID must be updated to match the new INSTALL_UUID
             # which was generated when this controller was installed prior to
             # doing the restore.
-            print("INSTALL_UUID=%s" % install_uuid)
-        elif line.startswith("management_interface=") or \
-                line.startswith("oam_interface=") or \
-                line.startswith("cluster_host_interface=") or \
-                line.startswith("UUID="):
+            line = "INSTALL_UUID=%s\n" % install_uuid
+        elif line.startswith(("management_interface=",
+                              "oam_interface=",
+                              "cluster_host_interface=",
+                              "UUID=")):
             # Strip out any entries that are host specific as the backup can
             # be done on either controller. The application of the
             # platform_conf manifest will add these back in.
-            pass
-        else:
-            print(line, end='')
-    fileinput.close()
+            continue
+        platform_conf.append(line)
+    with open(temp_platform_conf_file, 'w') as f:
+        f.writelines(platform_conf)
     # Move updated platform.conf file into place.
     os.rename(temp_platform_conf_file, tsconfig.PLATFORM_CONF_FILE)
 
@@ -400,9 +862,8 @@ def restore_configuration(archive, staging_dir):
 
 
 def filter_pxelinux(archive):
-    for tarinfo in archive:
-        if tarinfo.name.find('config/pxelinux.cfg') == 0:
-            yield tarinfo
+    return [tarinfo for tarinfo in filter_directory(archive, 'config')
+            if tarinfo.name.startswith('config/pxelinux.cfg')]
 
 
 def restore_dnsmasq(archive, config_permdir):
@@ -457,9 +918,9 @@ def backup_puppet_data(archive, puppet_permdir):
     try:
         # The puppet dir is versioned, but we're only grabbing the current
         # release
-        archive.add(puppet_permdir, arcname='hieradata')
+        archive_add_directory(archive, puppet_permdir, 'hieradata')
 
-    except tarfile.TarError:
+    except (subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup puppet data.")
         raise BackupFail("Failed to backup puppet data")
 
@@ -467,10 +928,10 @@ def backup_puppet_data(archive, puppet_permdir):
 def restore_static_puppet_data(archive, puppet_workdir):
     """ Restore static puppet data """
     try:
-        member = archive.getmember('hieradata/static.yaml')
+        member = get_archive_member(archive, 'hieradata/static.yaml')
         archive.extract(member, path=os.path.dirname(puppet_workdir))
 
-        member = archive.getmember('hieradata/secure_static.yaml')
+        member = get_archive_member(archive, 'hieradata/secure_static.yaml')
         archive.extract(member, path=os.path.dirname(puppet_workdir))
 
     except tarfile.TarError:
@@ -484,15 +945,15 @@ def restore_static_puppet_data(archive, puppet_workdir):
 def restore_puppet_data(archive, puppet_workdir, controller_0_address):
     """ Restore puppet data """
     try:
-        member = archive.getmember('hieradata/system.yaml')
+        member = get_archive_member(archive, 'hieradata/system.yaml')
         archive.extract(member, path=os.path.dirname(puppet_workdir))
 
-        member = archive.getmember('hieradata/secure_system.yaml')
+        member = get_archive_member(archive, 'hieradata/secure_system.yaml')
         archive.extract(member, path=os.path.dirname(puppet_workdir))
 
         # Only restore controller-0 hieradata
         controller_0_hieradata = 'hieradata/%s.yaml' % controller_0_address
-        member = archive.getmember(controller_0_hieradata)
+        member = get_archive_member(archive, controller_0_hieradata)
         archive.extract(member, path=os.path.dirname(puppet_workdir))
 
     except tarfile.TarError:
@@ -516,9 +977,9 @@ def backup_armada_manifest_size(armada_permdir):
 def backup_armada_manifest_data(archive, armada_permdir):
     """ Backup armada manifest data """
     try:
-        archive.add(armada_permdir, arcname='armada')
+        archive_add_directory(archive, armada_permdir, 'armada')
 
-    except tarfile.TarError:
+    except (subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup armada manifest data.")
         raise BackupFail("Failed to backup armada manifest data")
 
@@ -527,17 +988,8 @@ def restore_armada_manifest_data(archive, armada_permdir):
     """ Restore armada manifest data  """
     try:
         shutil.rmtree(armada_permdir, ignore_errors=True)
-        members = filter_directory(archive, 'armada')
-        temp_members = list()
-        # remove armada and armada/ from the member path since they are
-        # extracted to armada_permdir: /opt/platform/armada/release
-        for m in members:
-            temp_member = copy.copy(m)
-            lst = temp_member.name.split('armada/')
-            if len(lst) > 1:
-                temp_member.name = lst[1]
-                temp_members.append(temp_member)
-        archive.extractall(path=armada_permdir, members=temp_members)
+        # armada is extracted to armada_permdir: /opt/platform/armada/release
+        extract_directory(archive, 'armada', armada_permdir)
 
     except (tarfile.TarError, OSError):
         LOG.error("Failed to restore armada manifest.")
@@ -558,9 +1010,9 @@ def backup_keyring_size(keyring_permdir):
 def backup_keyring(archive, keyring_permdir):
     """ Backup keyring configuration """
     try:
-        archive.add(keyring_permdir, arcname='.keyring')
+        archive_add_directory(archive, keyring_permdir, '.keyring')
 
-    except tarfile.TarError:
+    except (subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup keyring.")
         raise BackupFail("Failed to backup keyring configuration")
 
@@ -569,19 +1021,11 @@ def restore_keyring(archive, keyring_permdir):
     """ Restore keyring configuration """
     try:
         shutil.rmtree(keyring_permdir, ignore_errors=False)
-        members = filter_directory(archive, '.keyring')
-        temp_members = list()
-        # remove .keyring and .keyring/ from the member path since they are
-        # extracted to keyring_permdir: /opt/platform/.keyring/release
-        for m in members:
-            temp_member = copy.copy(m)
-            lst = temp_member.name.split('.keyring/')
-            if len(lst) > 1:
-                temp_member.name = lst[1]
-                temp_members.append(temp_member)
-        archive.extractall(path=keyring_permdir, members=temp_members)
+        # .keyring is extracted to keyring_permdir:
+        # /opt/platform/.keyring/release
+        extract_directory(archive, '.keyring', keyring_permdir)
 
-    except (tarfile.TarError, shutil.Error):
+    except (tarfile.TarError, shutil.Error, OSError):
         LOG.error("Failed to restore keyring.")
         shutil.rmtree(keyring_permdir, ignore_errors=True)
         raise RestoreFail("Failed to restore keyring configuration")
@@ -625,21 +1069,12 @@ def cleanup_prefetched_keyring():
 def backup_ldap_size():
     """ Backup ldap size estimate """
     try:
-        total_size = 0
-
-        proc = subprocess.Popen(
-            ['slapcat -d 0 -F /etc/openldap/schema | wc -c'],
-            shell=True, stdout=subprocess.PIPE)
-
-        for line in proc.stdout:
-            total_size = int(line)
-            break
-
-        proc.communicate()
+        # The size of the database files is used as the estimate, as
+        # exporting the database just to measure it would double the work
+        # done by the backup. The exported ldif is smaller than the files.
+        return utils.directory_get_size(ldap_permdir)
 
-        return total_size
-
-    except subprocess.CalledProcessError:
+    except OSError:
         LOG.error("Failed to estimate backup ldap size.")
         raise BackupFail("Failed to estimate backup ldap size")
 
@@ -647,14 +1082,11 @@ def backup_ldap_size():
 def backup_ldap(archive, staging_dir):
     """ Backup ldap configuration """
     try:
-        ldap_staging_dir = staging_dir + '/ldap'
-        os.mkdir(ldap_staging_dir, 0o655)
-
-        subprocess.check_call([
-            'slapcat', '-d', '0', '-F', '/etc/openldap/schema',
-            '-l', (ldap_staging_dir + '/ldap.db')], stdout=DEVNULL)
-
-        archive.add(ldap_staging_dir + '/ldap.db', arcname='ldap.db')
+        # Stream the dump into the archive rather than writing it to the
+        # staging directory first.
+        archive_add_command_output(
+            archive, ['slapcat', '-d', '0', '-F', '/etc/openldap/schema'],
+            'ldap.db')
 
     except (OSError, subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup ldap database.")
@@ -669,7 +1101,8 @@ def restore_ldap(archive, ldap_permdir, staging_dir):
 
         utils.stop_lsb_service('openldap')
 
-        subprocess.call(['rm', '-rf', ldap_permdir], stdout=DEVNULL)
+        if os.path.exists(ldap_permdir):
+            shutil.rmtree(ldap_permdir)
         os.mkdir(ldap_permdir, 0o755)
 
         subprocess.check_call(['slapadd', '-F', '/etc/openldap/schema',
@@ -689,23 +1122,24 @@ def backup_mariadb_size():
     try:
         total_size = 0
 
-        os_backup_dbs = get_os_backup_databases()
-
-        # Backup data for databases.
-        for db_elem in os_backup_dbs:
+        # Estimate the size of the databases from the size of their tables,
+        # rather than dumping each database. The skipped databases are
+        # filtered here so that the database list is not queried as well.
+        query = ('SELECT table_schema, '
+                 'COALESCE(SUM(data_length + index_length), 0) '
+                 'FROM information_schema.tables GROUP BY table_schema')
 
-            db_cmd = kube_cmd_prefix + mysqldump_prefix
-            db_cmd += ' %s\' | wc -c' % db_elem
+        output = subprocess.check_output(
+            mariadb_cmd(mysql_cmd + '-Nse "%s"' % query), stderr=DEVNULL)
 
-            proc = subprocess.Popen([db_cmd], shell=True,
-                                    stdout=subprocess.PIPE, stderr=DEVNULL)
-
-            total_size += int(proc.stdout.readline())
-            proc.communicate()
+        for line in output.splitlines():
+            db_elem, db_size = line.split()
+            if db_elem not in os_skip_databases:
+                total_size += int(db_size)
 
         return total_size
 
-    except subprocess.CalledProcessError:
+    except (ValueError, OSError, subprocess.CalledProcessError):
         LOG.error("Failed to estimate MariaDB database size.")
         raise BackupFail("Failed to estimate MariaDB database size")
 
@@ -713,20 +1147,14 @@ def backup_mariadb_size():
 def backup_mariadb(archive, staging_dir):
     """ Backup MariaDB data """
     try:
-        mariadb_staging_dir = staging_dir + '/mariadb'
-        os.mkdir(mariadb_staging_dir, 0o655)
-
-        os_backup_dbs = get_os_backup_databases()
-
-        # Backup data for databases.
-        for db_elem in os_backup_dbs:
-            db_cmd = kube_cmd_prefix + mysqldump_prefix
-            db_cmd += ' %s\' > %s/%s.sql.data' % (db_elem,
-                                                  mariadb_staging_dir, db_elem)
-
-            subprocess.check_call([db_cmd], shell=True, stderr=DEVNULL)
-
-        archive.add(mariadb_staging_dir, arcname='mariadb')
+        # Backup data for databases. The databases are independent, so
+        # they are dumped concurrently.
+        archive_add_command_outputs(
+            archive,
+            [(mariadb_cmd(mysqldump_cmd + db_elem),
+              'mariadb/%s.sql.gz' % db_elem)
+             for db_elem in sorted(get_os_backup_databases())],
+            spool_dir=staging_dir, compress=True)
 
     except (OSError, subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup MariaDB databases.")
@@ -755,7 +1183,7 @@ def create_helm_overrides_directory():
     directory before running application-apply.
     """
     try:
-        os.mkdir(constants.HELM_OVERRIDES_PERMDIR, 0o755)
+        utils.create_directory(constants.HELM_OVERRIDES_PERMDIR, 0o755)
     except OSError:
         LOG.error("Failed to create helm overrides directory")
         raise BackupFail("Failed to create helm overrides directory")
@@ -767,22 +1195,25 @@ def restore_mariadb():
 
     This function is called after MariaDB service is up
     """
-    try:
-        mariadb_staging_dir = constants.BACKUPS_PATH + '/mariadb'
-        # Restore data for databases.
-        for data in glob.glob(mariadb_staging_dir + '/*.sql.data'):
-            db_elem = data.split('/')[-1].split('.')[0]
-            create_db = "create database %s" % db_elem
+    def restore_database(data):
+        db_elem = data.split('/')[-1].split('.')[0]
+        create_db = "create database %s" % db_elem
 
-            # Create the database
-            db_cmd = kube_cmd_prefix + mysql_prefix + '-e"%s" \'' % create_db
-            subprocess.check_call([db_cmd], shell=True, stderr=DEVNULL)
+        # Create the database
+        subprocess.check_call(
+            mariadb_cmd(mysql_cmd + '-e"%s"' % create_db), stderr=DEVNULL)
 
-            # Populate data
-            db_cmd = 'cat %s | ' % data
-            db_cmd = db_cmd + kube_cmd_prefix + mysql_prefix
-            db_cmd += '%s\' ' % db_elem
-            subprocess.check_call([db_cmd], shell=True, stderr=DEVNULL)
+        # Populate data
+        call_with_dump_input(mariadb_cmd(mysql_cmd + db_elem), data,
+                             stderr=DEVNULL)
+
+    try:
+        mariadb_staging_dir = constants.BACKUPS_PATH + '/mariadb'
+        # Restore data for databases. The databases are independent, so
+        # they are restored concurrently.
+        concurrent_map(restore_database,
+                       list_directory_files(mariadb_staging_dir,
+                                            ('.sql.gz', '.sql.data')))
 
         shutil.rmtree(mariadb_staging_dir, ignore_errors=True)
 
@@ -794,87 +1225,90 @@ def restore_mariadb():
 def backup_postgres_size():
     """ Backup postgres size estimate """
     try:
-        total_size = 0
-
-        # Backup roles, table spaces and schemas for databases.
-        proc = subprocess.Popen([('sudo -u postgres pg_dumpall --clean ' +
-                                  '--schema-only | wc -c')], shell=True,
-                                stdout=subprocess.PIPE, stderr=DEVNULL)
-
-        for line in proc.stdout:
-            total_size = int(line)
-            break
-
-        proc.communicate()
-
         # get backup database
-        backup_databases, backup_db_skip_tables = get_backup_databases()
-
-        # Backup data for databases.
-        for _, db_elem in enumerate(backup_databases):
-
-            db_cmd = 'sudo -u postgres pg_dump --format=plain --inserts '
-            db_cmd += '--disable-triggers --data-only %s ' % db_elem
-
-            for _, table_elem in enumerate(backup_db_skip_tables[db_elem]):
-                db_cmd += '--exclude-table=%s ' % table_elem
+        backup_databases, _ = get_backup_databases()
 
-            db_cmd += '| wc -c'
+        # Estimate the size of the databases from their size on disk,
+        # rather than dumping each database.
+        query = ("SELECT COALESCE(SUM(pg_database_size(datname)), 0) "
+                 "FROM pg_database WHERE datname IN (%s)" %
+                 ', '.join("'%s'" % db_elem for db_elem in backup_databases))
 
-            proc = subprocess.Popen([db_cmd], shell=True,
-                                    stdout=subprocess.PIPE, stderr=DEVNULL)
+        output = subprocess.check_output(
+            ['sudo', '-u', 'postgres', 'psql', '-tAc', query, 'postgres'],
+            stderr=DEVNULL)
 
-            for line in proc.stdout:
-                total_size += int(line)
-                break
-
-            proc.communicate()
+        return int(output)
 
-        return total_size
-
-    except subprocess.CalledProcessError:
+    except (ValueError, subprocess.CalledProcessError):
         LOG.error("Failed to estimate backup database size.")
         raise BackupFail("Failed to estimate backup database size")
 
 
 def backup_postgres(archive, staging_dir):
     """ Backup postgres configuration """
-    try:
-        postgres_staging_dir = staging_dir + '/postgres'
-        os.mkdir(postgres_staging_dir, 0o655)
 
+    def dump_command(db_elem):
+        # The data is dumped as COPY statements, which restore much faster
+        # than INSERT statements. The databases are recreated by the
+        # schema restore, so the tables are empty when the data is loaded.
+        db_cmd = ['sudo', '-u', 'postgres', 'pg_dump', '--format=plain',
+                  '--disable-triggers', '--data-only', db_elem]
+        db_cmd += ['--exclude-table=%s' % table_elem
+                   for table_elem in backup_db_skip_tables[db_elem]]
+
+        return db_cmd, 'postgres/%s.sql.data' % db_elem
+
+    try:
         # Backup roles, table spaces and schemas for databases.
-        subprocess.check_call([('sudo -u postgres pg_dumpall --clean ' +
-                                '--schema-only' +
-                                '> %s/%s' % (postgres_staging_dir,
-                                             'postgres.sql.config'))],
-                              shell=True, stderr=DEVNULL)
+        archive_add_command_output(
+            archive, ['sudo', '-u', 'postgres', 'pg_dumpall', '--clean',
+                      '--schema-only'], 'postgres/postgres.sql.config')
 
         # get backup database
         backup_databases, backup_db_skip_tables = get_backup_databases()
 
-        # Backup data for databases.
-        for _, db_elem in enumerate(backup_databases):
-
-            db_cmd = 'sudo -u postgres pg_dump --format=plain --inserts '
-            db_cmd += '--disable-triggers --data-only %s ' % db_elem
-
-            for _, table_elem in enumerate(backup_db_skip_tables[db_elem]):
-                db_cmd += '--exclude-table=%s ' % table_elem
-
-            db_cmd += '> %s/%s.sql.data' % (postgres_staging_dir, db_elem)
-
-            subprocess.check_call([db_cmd], shell=True, stderr=DEVNULL)
-
-        archive.add(postgres_staging_dir, arcname='postgres')
+        # Backup data for databases. The databases are independent, so
+        # they are dumped concurrently. The data dumps are not compressed,
+        # as clone edits them in the archive.
+        archive_add_command_outputs(
+            archive, [dump_command(db_elem) for db_elem in backup_databases],
+            spool_dir=staging_dir)
 
     except (OSError, subprocess.CalledProcessError, tarfile.TarError):
         LOG.error("Failed to backup postgres databases.")
         raise BackupFail("Failed to backup database configuration")
 
 
+def postgres_restore_conninfo(db_elem):
+    """
+    Get the psql connection string used to restore a postgres database.
+
+    The restore sessions do not wait for each commit to be flushed to
+    disk. If the restore is interrupted it has to be run again anyway, and
+    postgres flushes everything when it is stopped at the end of the
+    restore.
+    :param db_elem: database name
+    :return: connection string
+    """
+    return "dbname=%s options='-c synchronous_commit=off'" % db_elem
+
+
 def restore_postgres(archive, staging_dir):
     """ Restore postgres configuration """
+
+    def restore_database(data):
+        db_elem = data.split('/')[-1].split('.')[0]
+        # Load the data in a single transaction, so that it is committed
+        # once rather than per statement. An error stops the load and
+        # fails the restore, rather than leaving a partially loaded
+        # database.
+        subprocess.check_call(["sudo", "-u", "postgres", "psql",
+                               "--single-transaction",
+                               "-v", "ON_ERROR_STOP=1", "-f",
+                               data, postgres_restore_conninfo(db_elem)],
+                              stdout=DEVNULL)
+
     try:
         postgres_staging_dir = staging_dir + '/postgres'
         archive.extractall(path=staging_dir,
@@ -885,15 +1319,15 @@ def restore_postgres(archive, staging_dir):
         # Restore roles, table spaces and schemas for databases.
         subprocess.check_call(["sudo", "-u", "postgres", "psql", "-f",
                                postgres_staging_dir +
-                               '/postgres.sql.config', "postgres"],
+                               '/postgres.sql.config',
+                               postgres_restore_conninfo("postgres")],
                               stdout=DEVNULL, stderr=DEVNULL)
 
-        # Restore data for databases.
-        for data in glob.glob(postgres_staging_dir + '/*.sql.data'):
-            db_elem = data.split('/')[-1].split('.')[0]
-            subprocess.check_call(["sudo", "-u", "postgres", "psql", "-f",
-                                   data, db_elem],
-                                  stdout=DEVNULL)
+        # Restore data for databases. The databases are independent, so
+        # they are restored concurrently.
+        concurrent_map(restore_database,
+                       list_directory_files(postgres_staging_dir,
+                                            ('.sql.data',)))
 
     except (OSError, subprocess.CalledProcessError, tarfile.TarError) as e:
         LOG.error("Failed to restore postgres databases. Error: %s", e)
@@ -904,9 +1338,8 @@ def restore_postgres(archive, staging_dir):
 
 
 def filter_config_dir(archive, directory):
-    for tarinfo in archive:
-        if tarinfo.name.find('config/' + directory) == 0:
-            yield tarinfo
+    return [tarinfo for tarinfo in filter_directory(archive, 'config')
+            if tarinfo.name.startswith('config/' + directory)]
 
 
 def restore_config_dir(archive, staging_dir, config_dir, dest_dir):
@@ -918,16 +1351,15 @@ def restore_config_dir(archive, staging_dir, config_dir, dest_dir):
         # Copy files from backup to dest dir
         if (os.path.exists(staging_dir + '/config/' + config_dir) and
                 os.listdir(staging_dir + '/config/' + config_dir)):
-            subprocess.call(["mkdir", "-p", dest_dir])
+            utils.create_directory(dest_dir)
 
             try:
-                for f in glob.glob(
-                        staging_dir + '/config/' + config_dir + '/*'):
-                    subprocess.check_call(["cp", "-p", f, dest_dir])
-            except IOError:
+                copy_directory_contents(
+                    staging_dir + '/config/' + config_dir, dest_dir)
+            except (IOError, OSError):
                 LOG.warning("Failed to copy %s files" % config_dir)
 
-    except (subprocess.CalledProcessError, tarfile.TarError):
+    except (OSError, tarfile.TarError):
         LOG.info("No custom %s config was found during restore." % config_dir)
 
 
@@ -957,7 +1389,7 @@ def restore_std_dir(archive, directory):
         shutil.rmtree(directory, ignore_errors=True)
         # Verify that archive contains this directory
         try:
-            archive.getmember(os.path.basename(directory))
+            get_archive_member(archive, os.path.basename(directory))
         except KeyError:
             LOG.error("Archive does not contain directory %s" % directory)
             raise RestoreFail("Invalid backup file - missing directory %s" %
@@ -999,22 +1431,24 @@ def backup_ceph_crush_map(archive, staging_dir):
 
 def restore_ceph_crush_map(archive):
     """ Restore ceph crush map """
-    if not file_exists_in_archive(archive, 'ceph/' +
-                                  sysinv_constants.CEPH_CRUSH_MAP_BACKUP):
+    crush_map_file = 'ceph/' + sysinv_constants.CEPH_CRUSH_MAP_BACKUP
+    if not file_exists_in_archive(archive, crush_map_file):
         return
 
     try:
-        crush_map_file = 'ceph/' + sysinv_constants.CEPH_CRUSH_MAP_BACKUP
-        if file_exists_in_archive(archive, crush_map_file):
-            member = archive.getmember(crush_map_file)
-            # Copy the member to avoid changing the name for future
-            # operations on this member.
-            temp_member = copy.copy(member)
-            temp_member.name = os.path.basename(temp_member.name)
-            archive.extract(temp_member,
-                            path=sysinv_constants.SYSINV_CONFIG_PATH)
-
-    except tarfile.TarError as e:
+        member = get_archive_member(archive, crush_map_file)
+        crush_map_path = os.path.join(
+            sysinv_constants.SYSINV_CONFIG_PATH,
+            sysinv_constants.CEPH_CRUSH_MAP_BACKUP)
+        src = archive.extractfile(member)
+        try:
+            with open(crush_map_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        finally:
+            src.close()
+        os.chmod(crush_map_path, member.mode)
+
+    except (tarfile.TarError, IOError, OSError) as e:
         LOG.error('Failed to restore crush map file. Reason: {}'.format(e))
         raise RestoreFail('Failed to restore crush map file')
 
@@ -1023,22 +1457,35 @@ def check_size(archive_dir):
     """Check if there is enough space to create backup."""
     backup_overhead_bytes = 1024 ** 3  # extra GB for staging directory
 
-    backup_size = (backup_overhead_bytes +
-                   backup_etc_size() +
-                   backup_config_size(tsconfig.CONFIG_PATH) +
-                   backup_puppet_data_size(constants.HIERADATA_PERMDIR) +
-                   backup_keyring_size(keyring_permdir) +
-                   backup_ldap_size() +
-                   backup_postgres_size() +
-                   backup_std_dir_size(home_permdir) +
-                   backup_std_dir_size(patching_permdir) +
-                   backup_std_dir_size(patching_repo_permdir) +
-                   backup_std_dir_size(extension_permdir) +
-                   backup_std_dir_size(patch_vault_permdir) +
-                   backup_armada_manifest_size(constants.ARMADA_PERMDIR) +
-                   backup_std_dir_size(constants.HELM_CHARTS_PERMDIR) +
-                   backup_mariadb_size()
-                   )
+    def estimate_size(size_estimate):
+        size_func, args, _ = size_estimate
+        return size_func(*args)
+
+    # The estimates walk separate directory trees or query separate
+    # databases, so they are run concurrently. The data of the staged
+    # backup steps is stored twice while the backup is created, once in
+    # the staging directory and once in the system archive.
+    size_estimates = [
+        (backup_etc_size, (), True),
+        (backup_config_size, (tsconfig.CONFIG_PATH,), True),
+        (backup_puppet_data_size, (constants.HIERADATA_PERMDIR,), True),
+        (backup_keyring_size, (keyring_permdir,), True),
+        (backup_ldap_size, (), True),
+        (backup_postgres_size, (), True),
+        (backup_std_dir_size, (home_permdir,), False),
+        (backup_std_dir_size, (patching_permdir,), False),
+        (backup_std_dir_size, (patching_repo_permdir,), False),
+        (backup_std_dir_size, (extension_permdir,), False),
+        (backup_std_dir_size, (patch_vault_permdir,), False),
+        (backup_armada_manifest_size, (constants.ARMADA_PERMDIR,), True),
+        (backup_std_dir_size, (constants.HELM_CHARTS_PERMDIR,), False),
+        (backup_mariadb_size, (), True),
+    ]
+
+    sizes = concurrent_map(estimate_size, size_estimates)
+    backup_size = backup_overhead_bytes + sum(
+        size * 2 if staged else size
+        for size, (_, _, staged) in zip(sizes, size_estimates))
 
     archive_dir_free_space = \
         utils.filesystem_get_free_space(archive_dir)
@@ -1052,6 +1499,74 @@ def check_size(archive_dir):
         raise BackupFail("Not enough free space for backup.")
 
 
+def run_backup_step(step_archive):
+    """
+    Run a backup step, storing its data in a separate archive.
+    :param step_archive: tuple of archive path, backup function and
+                         additional arguments to the backup function
+    :return: size of the archive data, excluding the end-of-archive marker,
+             or None if the step was skipped
+    """
+    path, func, args = step_archive
+    if func is None:
+        return None
+
+    archive = tarfile.open(path, 'w')
+    try:
+        func(archive, *args)
+        return archive.offset
+    finally:
+        archive.close()
+
+
+def archive_append_archive(archive, path, size):
+    """
+    Append the members of an uncompressed archive to another archive.
+    :param archive: archive opened for writing
+    :param path: uncompressed archive to append
+    :param size: size of the archive data, excluding the end-of-archive
+                 marker
+    """
+    with open(path, 'rb') as f:
+        tarfile.copyfileobj(f, archive.fileobj, size)
+    archive.offset += size
+
+
+def open_compressed_archive(path):
+    """
+    Open an archive for writing, compressed by an external process.
+    :param path: path of the compressed archive
+    :return: archive and compression process
+    """
+    with open(path, 'wb') as f:
+        proc = subprocess.Popen(COMPRESS_CMD, stdin=subprocess.PIPE,
+                                stdout=f, stderr=DEVNULL)
+    try:
+        archive = tarfile.open(fileobj=proc.stdin, mode='w|',
+                               bufsize=TARFILE_COPY_BUFSIZE)
+    except Exception:
+        proc.kill()
+        proc.wait()
+        raise
+    return archive, proc
+
+
+def close_compressed_archive(archive, proc):
+    """
+    Close an archive opened by open_compressed_archive.
+    :param archive: archive opened for writing
+    :param proc: compression process
+    """
+    try:
+        archive.close()
+    finally:
+        proc.stdin.close()
+        proc.wait()
+
+    if proc.returncode != 0:
+        raise BackupFail("Failed to compress backup archive.")
+
+
 def backup(backup_name, archive_dir, clone=False):
     """Backup configuration."""
 
@@ -1087,6 +1602,7 @@ def backup(backup_name, archive_dir, clone=False):
 
     staging_dir = None
     system_tar_path = None
+    compress_proc = None
     warnings = ''
     try:
         os.chdir('/')
@@ -1099,97 +1615,84 @@ def backup(backup_name, archive_dir, clone=False):
 
         system_tar_path = os.path.join(archive_dir,
                                        backup_name + '_system.tgz')
-        system_archive = tarfile.open(system_tar_path, "w:gz")
+        # Compression is done by a separate process, so that it runs in
+        # parallel with the backup and can use multiple cores.
+        system_archive, compress_proc = open_compressed_archive(
+            system_tar_path)
 
         step = 1
         total_steps = 16
 
-        # Step 1: Backup etc
-        backup_etc(system_archive)
-        utils.progress(total_steps, step, 'backup etc', 'DONE')
-        step += 1
-
-        # Step 2: Backup configuration
-        backup_config(system_archive, tsconfig.CONFIG_PATH)
-        utils.progress(total_steps, step, 'backup configuration', 'DONE')
-        step += 1
-
-        # Step 3: Backup puppet data
-        backup_puppet_data(system_archive, constants.HIERADATA_PERMDIR)
-        utils.progress(total_steps, step, 'backup puppet data', 'DONE')
-        step += 1
-
-        # Step 4: Backup armada data
-        backup_armada_manifest_data(system_archive, constants.ARMADA_PERMDIR)
-        utils.progress(total_steps, step, 'backup armada data', 'DONE')
-        step += 1
-
-        # Step 5: Backup helm charts data
-        backup_std_dir(system_archive, constants.HELM_CHARTS_PERMDIR)
-        utils.progress(total_steps, step, 'backup helm charts', 'DONE')
-        step += 1
-
-        # Step 6: Backup keyring
-        backup_keyring(system_archive, keyring_permdir)
-        utils.progress(total_steps, step, 'backup keyring', 'DONE')
-        step += 1
-
-        # Step 7: Backup ldap
-        backup_ldap(system_archive, staging_dir)
-        utils.progress(total_steps, step, 'backup ldap', 'DONE')
-        step += 1
-
-        # Step 8: Backup postgres
-        backup_postgres(system_archive, staging_dir)
-        utils.progress(total_steps, step, 'backup postgres', 'DONE')
-        step += 1
-
-        # Step 9: Backup mariadb
-        backup_mariadb(system_archive, staging_dir)
-        utils.progress(total_steps, step, 'backup mariadb', 'DONE')
-        step += 1
-
-        # Step 10: Backup home
-        backup_std_dir(system_archive, home_permdir)
-        utils.progress(total_steps, step, 'backup home directory', 'DONE')
-        step += 1
-
-        # Step 11: Backup patching
-        if not clone:
-            backup_std_dir(system_archive, patching_permdir)
-            utils.progress(total_steps, step, 'backup patching', 'DONE')
-        step += 1
-
-        # Step 12: Backup patching repo
-        if not clone:
-            backup_std_dir(system_archive, patching_repo_permdir)
-            utils.progress(total_steps, step, 'backup patching repo', 'DONE')
-        step += 1
-
-        # Step 13: Backup extension filesystem
-        backup_std_dir(system_archive, extension_permdir)
-        utils.progress(total_steps, step, 'backup extension filesystem '
-                                          'directory', 'DONE')
-        step += 1
-
-        # Step 14: Backup patch-vault filesystem
-        if os.path.exists(patch_vault_permdir):
-            backup_std_dir(system_archive, patch_vault_permdir)
-            utils.progress(total_steps, step, 'backup patch-vault filesystem '
-                                              'directory', 'DONE')
-        step += 1
-
-        # Step 15: Backup ceph crush map
-        backup_ceph_crush_map(system_archive, staging_dir)
-        utils.progress(total_steps, step, 'backup ceph crush map', 'DONE')
-        step += 1
+        # Steps 1 to 15 back up disjoint sets of files and databases. The
+        # small and database steps are run concurrently, each writing to
+        # its own archive in the staging directory, which is then appended
+        # to the system archive in step order. The large directory steps
+        # are written straight to the system archive in between, so that
+        # they are not stored twice.
+        backup_steps = [
+            ('backup etc', backup_etc, (), True),
+            ('backup configuration', backup_config,
+             (tsconfig.CONFIG_PATH,), True),
+            ('backup puppet data', backup_puppet_data,
+             (constants.HIERADATA_PERMDIR,), True),
+            ('backup armada data', backup_armada_manifest_data,
+             (constants.ARMADA_PERMDIR,), True),
+            ('backup helm charts', backup_std_dir,
+             (constants.HELM_CHARTS_PERMDIR,), False),
+            ('backup keyring', backup_keyring, (keyring_permdir,), True),
+            ('backup ldap', backup_ldap, (staging_dir,), True),
+            ('backup postgres', backup_postgres, (staging_dir,), True),
+            ('backup mariadb', backup_mariadb, (staging_dir,), True),
+            ('backup home directory', backup_std_dir, (home_permdir,),
+             False),
+            ('backup patching', None if clone else backup_std_dir,
+             (patching_permdir,), False),
+            ('backup patching repo', None if clone else backup_std_dir,
+             (patching_repo_permdir,), False),
+            ('backup extension filesystem directory', backup_std_dir,
+             (extension_permdir,), False),
+            ('backup patch-vault filesystem directory',
+             backup_std_dir if os.path.exists(patch_vault_permdir) else None,
+             (patch_vault_permdir,), False),
+            ('backup ceph crush map', backup_ceph_crush_map,
+             (staging_dir,), True),
+        ]
+
+        step_archives = [
+            (os.path.join(staging_dir, 'step%d.tar' % index), func, args)
+            for index, (_, func, args, staged) in enumerate(backup_steps,
+                                                            step)
+            if staged]
+
+        pool = ThreadPool(min(MAX_WORKERS, cpu_count(), len(step_archives)))
+        try:
+            results = pool.imap(run_backup_step, step_archives)
+            step_archives = iter(step_archives)
+            for action, func, args, staged in backup_steps:
+                if staged:
+                    path = next(step_archives)[0]
+                    size = next(results)
+                    if func is not None:
+                        archive_append_archive(system_archive, path, size)
+                        os.remove(path)
+                elif func is not None:
+                    func(system_archive, *args)
+                if func is not None:
+                    utils.progress(total_steps, step, action, 'DONE')
+                step += 1
+        finally:
+            pool.terminate()
+            pool.join()
 
         # Step 16: Create archive
-        system_archive.close()
+        close_compressed_archive(system_archive, compress_proc)
         utils.progress(total_steps, step, 'create archive', 'DONE')
         step += 1
 
     except Exception:
+        if compress_proc and compress_proc.returncode is None:
+            compress_proc.kill()
+            compress_proc.wait()
         if system_tar_path and os.path.isfile(system_tar_path):
             os.remove(system_tar_path)
 
@@ -1221,6 +1724,42 @@ def create_restore_runtime_config(filename):
     utils.create_manifest_runtime_config(filename, config)
 
 
+def remove_directory_in_background(directory):
+    """
+    Remove a directory tree in a separate thread, so the caller does not
+    wait for a large tree to be deleted. The thread is not a daemon
+    thread, so the process does not exit before the tree is removed.
+    :param directory: directory to remove
+    :return: the thread removing the directory
+    """
+    thread = threading.Thread(target=shutil.rmtree, args=(directory,),
+                              kwargs={'ignore_errors': True})
+    thread.start()
+    return thread
+
+
+def wait_for_worker_manifests(timeout=300, interval=30):
+    """
+    Wait for the worker manifests to be applied. This controller reboots
+    once they have been applied, so the wait only ends if applying them
+    fails or times out. Progress is shown on the console every interval
+    seconds.
+    :param timeout: timeout in seconds
+    :param interval: seconds between progress messages
+    :return: True if applying the manifests failed, False on timeout
+    """
+    start = time.time()
+    next_progress = start + interval
+    while time.time() - start < timeout:
+        if os.path.exists(constants.CONFIG_FAIL_FILE):
+            return True
+        if time.time() >= next_progress:
+            print("worker manifest apply in progress ... ")
+            next_progress += interval
+        time.sleep(1)
+    return False
+
+
 def restore_system(backup_file, include_storage_reinstall=False, clone=False):
     """Restoring system configuration."""
 
@@ -1246,6 +1785,7 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
     # Add newline to console log for install-clone scenario
     newline = clone
     staging_dir = None
+    staging_cleanup = None
 
     try:
         try:
@@ -1262,7 +1802,7 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
         # until /opt/backups is available
         staging_dir = tempfile.mkdtemp(dir='/scratch')
         # Permission change required or postgres restore fails
-        subprocess.call(['chmod', 'a+rx', staging_dir], stdout=DEVNULL)
+        os.chmod(staging_dir, 0o755)
         os.chdir('/')
 
         step = 1
@@ -1270,7 +1810,10 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
 
         # Step 1: Open archive and verify installed load matches backup
         try:
-            archive = tarfile.open(backup_file)
+            archive = open_archive(backup_file)
+            # Read all of the member headers once, up front. The restore
+            # steps look members up in the resulting indexes.
+            index_archive(archive)
         except tarfile.TarError as e:
             LOG.exception(e)
             raise RestoreFail("Error opening backup file. Invalid backup "
@@ -1456,7 +1999,7 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
         shutil.rmtree(staging_dir, ignore_errors=True)
         staging_dir = tempfile.mkdtemp(dir=constants.BACKUPS_PATH)
         # Permission change required or postgres restore fails
-        subprocess.call(['chmod', 'a+rx', staging_dir], stdout=DEVNULL)
+        os.chmod(staging_dir, 0o755)
 
         # Step 11: Apply banner customization
         utils.apply_banner_customization()
@@ -1469,45 +2012,61 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
         utils.progress(total_steps, step, 'restore dnsmasq', 'DONE', newline)
         step += 1
 
-        # Step 13: Restore keyring
+        # Steps 13 to 23 restore data from the archive in the order it is
+        # stored in the archive. Reading the compressed archive backwards
+        # means decompressing it again from the start.
+
+        # Step 13: Restore external ceph configuration files.
+        restore_ceph_external_config_files(archive, staging_dir)
+        utils.progress(total_steps, step, 'restore CEPH external config',
+                       'DONE', newline)
+        step += 1
+
+        # Step 14: Restore Armada manifest
+        restore_armada_manifest_data(archive, constants.ARMADA_PERMDIR)
+        utils.progress(total_steps, step, 'restore armada manifest',
+                       'DONE', newline)
+        step += 1
+
+        # Step 15: Restore Helm charts
+        restore_std_dir(archive, constants.HELM_CHARTS_PERMDIR)
+        utils.progress(total_steps, step, 'restore helm charts',
+                       'DONE', newline)
+        step += 1
+
+        # Step 16: Restore keyring
         restore_keyring(archive, keyring_permdir)
         utils.progress(total_steps, step, 'restore keyring', 'DONE', newline)
         step += 1
 
-        # Step 14: Restore ldap
+        # Step 17: Restore ldap
         restore_ldap(archive, ldap_permdir, staging_dir)
         utils.progress(total_steps, step, 'restore ldap', 'DONE', newline)
         step += 1
 
-        # Step 15: Restore postgres
+        # Step 18: Restore postgres
         restore_postgres(archive, staging_dir)
         utils.progress(total_steps, step, 'restore postgres', 'DONE', newline)
         step += 1
 
-        # Step 16: Extract and store mariadb data
+        # Step 19: Extract and store mariadb data
         extract_mariadb_data(archive)
         utils.progress(total_steps, step, 'extract mariadb', 'DONE', newline)
         step += 1
 
-        # Step 17: Restore ceph crush map
-        restore_ceph_crush_map(archive)
-        utils.progress(total_steps, step, 'restore ceph crush map', 'DONE',
-                       newline)
-        step += 1
-
-        # Step 18: Restore home
+        # Step 20: Restore home
         restore_std_dir(archive, home_permdir)
         utils.progress(total_steps, step, 'restore home directory', 'DONE',
                        newline)
         step += 1
 
-        # Step 19: Restore extension filesystem
+        # Step 21: Restore extension filesystem
         restore_std_dir(archive, extension_permdir)
         utils.progress(total_steps, step, 'restore extension filesystem '
                                           'directory', 'DONE', newline)
         step += 1
 
-        # Step 20: Restore patch-vault filesystem
+        # Step 22: Restore patch-vault filesystem
         if file_exists_in_archive(archive,
                                   os.path.basename(patch_vault_permdir)):
             restore_std_dir(archive, patch_vault_permdir)
@@ -1516,22 +2075,10 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
 
         step += 1
 
-        # Step 21: Restore external ceph configuration files.
-        restore_ceph_external_config_files(archive, staging_dir)
-        utils.progress(total_steps, step, 'restore CEPH external config',
-                       'DONE', newline)
-        step += 1
-
-        # Step 22: Restore Armada manifest
-        restore_armada_manifest_data(archive, constants.ARMADA_PERMDIR)
-        utils.progress(total_steps, step, 'restore armada manifest',
-                       'DONE', newline)
-        step += 1
-
-        # Step 23: Restore Helm charts
-        restore_std_dir(archive, constants.HELM_CHARTS_PERMDIR)
-        utils.progress(total_steps, step, 'restore helm charts',
-                       'DONE', newline)
+        # Step 23: Restore ceph crush map
+        restore_ceph_crush_map(archive)
+        utils.progress(total_steps, step, 'restore ceph crush map', 'DONE',
+                       newline)
         step += 1
 
         # Step 24: Create Helm overrides directory
@@ -1551,10 +2098,11 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
         # Step 26: Recover services
         utils.mtce_restart()
         utils.mark_config_complete()
-        time.sleep(120)
 
+        # Poll for the services rather than waiting a fixed time for them to
+        # start. The timeout allows for the time previously spent waiting.
         for service in ['sysinv-conductor', 'sysinv-inv']:
-            if not utils.wait_sm_service(service):
+            if not utils.wait_sm_service(service, timeout=300):
                 raise RestoreFail("Services have failed to initialize.")
 
         utils.progress(total_steps, step, 'recover services', 'DONE', newline)
@@ -1605,8 +2153,8 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
                                                      utils.progress,
                                                      timeout=lock_timeout)
                     # Don't power off nodes that could not be locked
-                    if len(failed_hosts) > 0:
-                        skip_hosts.append(failed_hosts)
+                    if failed_hosts:
+                        skip_hosts.extend(failed_hosts)
 
                 except (KeystoneFail, SysInvFail) as e:
                     LOG.exception(e)
@@ -1647,7 +2195,7 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
     finally:
         os.remove(restore_in_progress)
         if staging_dir:
-            shutil.rmtree(staging_dir, ignore_errors=True)
+            staging_cleanup = remove_directory_in_background(staging_dir)
         cleanup_prefetched_keyring()
 
     fmApi = fm_api.FaultAPIs()
@@ -1670,19 +2218,20 @@ def restore_system(backup_file, include_storage_reinstall=False, clone=False):
     fmApi.set_fault(fault)
 
     if utils.get_system_type() == sysinv_constants.TIS_AIO_BUILD:
-        print("\nApplying worker manifests for %s. " %
-              (utils.get_controller_hostname()))
+        hostname = utils.get_controller_hostname()
+        print("\nApplying worker manifests for %s. " % hostname)
         print("Node will reboot on completion.")
 
-        sysinv.do_worker_config_complete(utils.get_controller_hostname())
+        # Finish removing the staging directory before the reboot
+        if staging_cleanup:
+            staging_cleanup.join()
 
-        # show in-progress log on console every 30 seconds
-        # until self reboot or timeout
+        sysinv.do_worker_config_complete(hostname)
 
-        time.sleep(30)
-        for i in range(1, 10):
-            print("worker manifest apply in progress ... ")
-            time.sleep(30)
+        # Show in-progress log on console until self reboot, failure or
+        # timeout
+        if wait_for_worker_manifests():
+            raise RestoreFail("Failed to apply worker manifests")
 
         raise RestoreFail("Timeout running worker manifests, "
                           "reboot did not occur")
@@ -620,7 +620,7 @@ def update_backup_archive(backup_name, archive_dir):
     tmpdir = tempfile.mkdtemp(dir=archive_dir)
     try:
         subprocess.check_call(
-            ['gunzip', path_to_archive + '.tgz'],
+            ['pigz', '-d', path_to_archive + '.tgz'],
             stdout=DEVNULL, stderr=DEVNULL)
         # 70-persistent-net.rules with the correct MACs will be
         # generated on the linux boot on the cloned side. Remove
@@ -648,7 +648,7 @@ def update_backup_archive(backup_name, archive_dir):
              'etc', 'postgres', 'config',
              'hieradata'],
             stdout=DEVNULL, stderr=DEVNULL)
-        subprocess.check_call(['gzip', path_to_archive + '.tar'])
+        subprocess.check_call(['pigz', path_to_archive + '.tar'])
         shutil.move(path_to_archive + '.tar.gz', path_to_archive + '.tgz')
 
     except Exception as e:
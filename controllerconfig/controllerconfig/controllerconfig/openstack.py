@@ -11,6 +11,7 @@ OpenStack
 import os
 import time
 import subprocess
+from multiprocessing.pool import ThreadPool
 
 from controllerconfig.common import log
 from controllerconfig.common.exceptions import SysInvFail
@@ -23,6 +24,29 @@ LOG = log.get_logger(__name__)
 KEYSTONE_AUTH_SERVER_RETRY_CNT = 60
 KEYSTONE_AUTH_SERVER_WAIT = 1  # 1sec wait per retry
 
+# Maximum number of hosts that requests are made for concurrently
+HOST_REQUEST_MAX_WORKERS = 16
+
+# Keystone tokens obtained by clients, by credentials. A token is reused by
+# later clients with the same credentials until it is about to expire.
+_admin_tokens = {}
+
+
+def map_hosts(func, hosts):
+    """ Apply a function to each host concurrently. The requests made for
+        different hosts are independent, so they are not made one at a time.
+        Returns the results in the same order as the hosts.
+    """
+    if not hosts:
+        return []
+
+    pool = ThreadPool(min(HOST_REQUEST_MAX_WORKERS, len(hosts)))
+    try:
+        return pool.map(func, hosts)
+    finally:
+        pool.terminate()
+        pool.join()
+
 
 class OpenStack(object):
 
@@ -37,8 +61,9 @@ class OpenStack(object):
             proc = subprocess.Popen(
                 ['bash', '-c', source_command],
                 stdout=subprocess.PIPE, stderr=fnull)
+            output, _ = proc.communicate()
 
-        for line in proc.stdout:
+        for line in output.splitlines():
             key, _, value = line.partition("=")
             if key == 'OS_USERNAME':
                 self.conf['admin_user'] = value.strip()
@@ -55,8 +80,6 @@ class OpenStack(object):
             elif key == 'OS_PROJECT_DOMAIN_NAME':
                 self.conf['project_domain'] = value.strip()
 
-        proc.communicate()
-
     def __enter__(self):
         if not self._connect():
             raise Exception('Failed to connect')
@@ -74,6 +97,12 @@ class OpenStack(object):
         if self.admin_token is not None:
             self._disconnect()
 
+        credentials = tuple(sorted(self.conf.items()))
+        admin_token = _admin_tokens.get(credentials)
+        if admin_token is not None and not admin_token.is_expired():
+            self.admin_token = admin_token
+            return True
+
         # Try to obtain an admin token from keystone
         for _ in range(KEYSTONE_AUTH_SERVER_RETRY_CNT):
             self.admin_token = get_token(self.conf['auth_url'],
@@ -83,6 +112,7 @@ class OpenStack(object):
                                          self.conf['user_domain'],
                                          self.conf['project_domain'])
             if self.admin_token:
+                _admin_tokens[credentials] = self.admin_token
                 break
             time.sleep(KEYSTONE_AUTH_SERVER_WAIT)
 
@@ -92,6 +122,22 @@ class OpenStack(object):
         """ Disconnect from an OpenStack instance """
         self.admin_token = None
 
+    def _refresh_hosts(self, hosts):
+        """ Ask the System Inventory for an updated view of hosts. All of
+            the hosts are refreshed from a single request for the host list.
+        """
+        if not hosts:
+            return
+
+        current_hosts = dict((host.name, host) for host in
+                             sysinv.get_hosts(self.admin_token,
+                                              self.conf['region_name']))
+        for host in hosts:
+            current_host = current_hosts.get(host.name)
+            if current_host is not None:
+                # Update the existing objects, which the callers hold
+                host.__dict__.update(current_host.__dict__)
+
     def lock_hosts(self, exempt_hostnames=None, progress_callback=None,
                    timeout=60):
         """ Lock hosts of an OpenStack instance except for host names
@@ -110,18 +156,14 @@ class OpenStack(object):
 
         wait = False
         host_i = 0
+        unlocked_hosts = []
 
         for host in hosts:
             if host.name in exempt_hostnames:
                 continue
 
             if host.is_unlocked():
-                if not host.force_lock(self.admin_token,
-                                       self.conf['region_name']):
-                    failed_hostnames.append(host.name)
-                    LOG.warning("Could not lock %s" % host.name)
-                else:
-                    wait = True
+                unlocked_hosts.append(host)
             else:
                 host_i += 1
                 if progress_callback is not None:
@@ -129,6 +171,17 @@ class OpenStack(object):
                                       ('locking %s' % host.name),
                                       'DONE')
 
+        locked = map_hosts(
+            lambda host: host.force_lock(self.admin_token,
+                                         self.conf['region_name']),
+            unlocked_hosts)
+        for host, host_locked in zip(unlocked_hosts, locked):
+            if not host_locked:
+                failed_hostnames.append(host.name)
+                LOG.warning("Could not lock %s" % host.name)
+            else:
+                wait = True
+
         if wait and timeout > 5:
             time.sleep(5)
             timeout -= 5
@@ -136,24 +189,23 @@ class OpenStack(object):
         for _ in range(0, timeout):
             wait = False
 
-            for host in hosts:
-                if host.name in exempt_hostnames:
-                    continue
-
-                if (host.name not in failed_hostnames) and host.is_unlocked():
-                    host.refresh_data(self.admin_token,
-                                      self.conf['region_name'])
-
-                    if host.is_locked():
-                        LOG.info("Locked %s" % host.name)
-                        host_i += 1
-                        if progress_callback is not None:
-                            progress_callback(len(hosts), host_i,
-                                              ('locking %s' % host.name),
-                                              'DONE')
-                    else:
-                        LOG.info("Waiting for lock of %s" % host.name)
-                        wait = True
+            waiting_hosts = [host for host in hosts
+                             if host.name not in exempt_hostnames and
+                             host.name not in failed_hostnames and
+                             host.is_unlocked()]
+            self._refresh_hosts(waiting_hosts)
+
+            for host in waiting_hosts:
+                if host.is_locked():
+                    LOG.info("Locked %s" % host.name)
+                    host_i += 1
+                    if progress_callback is not None:
+                        progress_callback(len(hosts), host_i,
+                                          ('locking %s' % host.name),
+                                          'DONE')
+                else:
+                    LOG.info("Waiting for lock of %s" % host.name)
+                    wait = True
 
             if not wait:
                 break
@@ -184,16 +236,14 @@ class OpenStack(object):
 
         wait = False
         host_i = 0
+        powered_on_hosts = []
 
         for host in hosts:
             if host.name in exempt_hostnames:
                 continue
 
             if host.is_powered_on():
-                if not host.power_off(self.admin_token,
-                                      self.conf['region_name']):
-                    raise SysInvFail("Could not power-off %s" % host.name)
-                wait = True
+                powered_on_hosts.append(host)
             else:
                 host_i += 1
                 if progress_callback is not None:
@@ -201,6 +251,15 @@ class OpenStack(object):
                                       ('powering off %s' % host.name),
                                       'DONE')
 
+        powered_off = map_hosts(
+            lambda host: host.power_off(self.admin_token,
+                                        self.conf['region_name']),
+            powered_on_hosts)
+        for host, host_powered_off in zip(powered_on_hosts, powered_off):
+            if not host_powered_off:
+                raise SysInvFail("Could not power-off %s" % host.name)
+            wait = True
+
         if wait and timeout > 5:
             time.sleep(5)
             timeout -= 5
@@ -208,24 +267,22 @@ class OpenStack(object):
         for _ in range(0, timeout):
             wait = False
 
-            for host in hosts:
-                if host.name in exempt_hostnames:
-                    continue
-
-                if host.is_powered_on():
-                    host.refresh_data(self.admin_token,
-                                      self.conf['region_name'])
-
-                    if host.is_powered_off():
-                        LOG.info("Powered-Off %s" % host.name)
-                        host_i += 1
-                        if progress_callback is not None:
-                            progress_callback(len(hosts), host_i,
-                                              ('powering off %s' % host.name),
-                                              'DONE')
-                    else:
-                        LOG.info("Waiting for power-off of %s" % host.name)
-                        wait = True
+            waiting_hosts = [host for host in hosts
+                             if host.name not in exempt_hostnames and
+                             host.is_powered_on()]
+            self._refresh_hosts(waiting_hosts)
+
+            for host in waiting_hosts:
+                if host.is_powered_off():
+                    LOG.info("Powered-Off %s" % host.name)
+                    host_i += 1
+                    if progress_callback is not None:
+                        progress_callback(len(hosts), host_i,
+                                          ('powering off %s' % host.name),
+                                          'DONE')
+                else:
+                    LOG.info("Waiting for power-off of %s" % host.name)
+                    wait = True
 
             if not wait:
                 break
@@ -240,32 +297,34 @@ class OpenStack(object):
     def wait_for_hosts_disabled(self, exempt_hostnames=None, timeout=300,
                                 interval_step=10):
         """Wait for hosts to be identified as disabled.
-           Run check every interval_step seconds
+           The check is run straight away, then after an interval that
+           starts at one second and doubles up to interval_step seconds
         """
         if exempt_hostnames is None:
             exempt_hostnames = []
 
-        for _ in range(timeout / interval_step):
+        deadline = time.time() + timeout
+        interval = 1
+        while True:
             hosts = sysinv.get_hosts(self.admin_token,
                                      self.conf['region_name'])
-            if not hosts:
-                time.sleep(interval_step)
-                continue
-
-            for host in hosts:
-                if host.name in exempt_hostnames:
-                    continue
-
-                if host.is_enabled():
-                    LOG.info("host %s is still enabled" % host.name)
-                    break
-            else:
-                LOG.info("all hosts disabled.")
-                return True
-
-            time.sleep(interval_step)
-
-        return False
+            if hosts:
+                for host in hosts:
+                    if host.name in exempt_hostnames:
+                        continue
+
+                    if host.is_enabled():
+                        LOG.info("host %s is still enabled" % host.name)
+                        break
+                else:
+                    LOG.info("all hosts disabled.")
+                    return True
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, interval_step)
 
     @property
     def sysinv(self):
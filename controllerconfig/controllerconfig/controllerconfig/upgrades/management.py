@@ -67,26 +67,25 @@ def export_postgres(dest_dir, shared_services):
         upgrade_databases, upgrade_database_skip_tables = \
             get_upgrade_databases(shared_services)
         # Dump roles, table spaces and schemas for databases.
-        subprocess.check_call([('sudo -u postgres pg_dumpall --clean ' +
-                                '--schema-only > %s/%s' %
-                                (dest_dir, 'postgres.sql.config'))],
-                              shell=True, stderr=devnull)
+        with open(os.path.join(dest_dir, 'postgres.sql.config'), 'w') as f:
+            subprocess.check_call(['sudo', '-u', 'postgres', 'pg_dumpall',
+                                   '--clean', '--schema-only'],
+                                  stdout=f, stderr=devnull)
 
         # Dump data for databases.
-        for _a, db_elem in enumerate(upgrade_databases):
+        for db_elem in upgrade_databases:
 
-            db_cmd = 'sudo -u postgres pg_dump --format=plain --inserts '
-            db_cmd += '--disable-triggers --data-only %s ' % db_elem
+            db_cmd = ['sudo', '-u', 'postgres', 'pg_dump', '--format=plain',
+                      '--inserts', '--disable-triggers', '--data-only',
+                      db_elem]
+            db_cmd += ['--exclude-table=%s' % table_elem
+                       for table_elem in upgrade_database_skip_tables[db_elem]]
 
-            for _b, table_elem in \
-                    enumerate(upgrade_database_skip_tables[db_elem]):
-                db_cmd += '--exclude-table=%s ' % table_elem
+            with open(os.path.join(dest_dir, db_elem + '.sql.data'),
+                      'w') as f:
+                subprocess.check_call(db_cmd, stdout=f, stderr=devnull)
 
-            db_cmd += '> %s/%s.sql.data' % (dest_dir, db_elem)
-
-            subprocess.check_call([db_cmd], shell=True, stderr=devnull)
-
-    except subprocess.CalledProcessError:
+    except (IOError, subprocess.CalledProcessError):
         LOG.exception("Failed to export postgres databases for upgrade.")
         raise
 
@@ -14,6 +14,7 @@ import glob
 import os
 import shutil
 import socket
+import stat
 import subprocess
 import time
 import sys
@@ -73,19 +74,47 @@ def directory_get_size(start_dir, regex=None):
     :param regex: only include files matching this regex (if provided)
     :return: size in bytes
     """
+    # Walk the tree with a single lstat() per entry. os.walk() stats each
+    # entry to find the directories, which would then be followed by a
+    # second stat() to get the size of each file.
     total_size = 0
-    for dirpath, _, filenames in os.walk(start_dir):
-        for filename in filenames:
-            if regex is None or regex.match(filename):
-                filep = os.path.join(dirpath, filename)
-                try:
-                    total_size += os.path.getsize(filep)
-                except OSError as e:
-                    if e.errno != errno.ENOENT:
-                        raise e
+    dirs = [start_dir]
+    while dirs:
+        dirpath = dirs.pop()
+        try:
+            names = os.listdir(dirpath)
+        except OSError:
+            # Unreadable or removed directories are skipped, as os.walk()
+            # does.
+            continue
+        for name in names:
+            filep = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(filep)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise e
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                dirs.append(filep)
+            elif regex is None or regex.match(name):
+                total_size += st.st_size
     return total_size
 
 
+def create_directory(path, mode=0o777):
+    """
+    Create a directory and any missing parents, unless it already exists
+    :param path: directory to create
+    :param mode: permissions of the created directories
+    """
+    try:
+        os.makedirs(path, mode)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
 def print_bytes(sizeof):
     """ Pretty print bytes """
     for size in ['Bytes', 'KB', 'MB', 'GB', 'TB']:
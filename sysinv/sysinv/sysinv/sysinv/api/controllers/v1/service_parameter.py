@@ -7,12 +7,10 @@
 # coding=utf-8
 #
 
-import copy
 import pecan
 from fm_api import constants as fm_constants
 from fm_api import fm_api
 from pecan import rest
-import six
 import wsme
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
@@ -36,6 +34,12 @@ from sysinv.openstack.common.rpc import common as rpc_common
 
 LOG = log.getLogger(__name__)
 
+FM = fm_api.FaultAPIs()
+
+# Fields of a service parameter that are shown when it is not expanded
+SUMMARY_FIELDS = frozenset(['uuid', 'service', 'section', 'name', 'value',
+                            'personality', 'resource'])
+
 
 class ServiceParameterPatchType(types.JsonPatchType):
     @staticmethod
@@ -78,24 +82,38 @@ class ServiceParameter(base.APIBase):
     links = [link.Link]
     "A list containing a self link and associated links"
 
+    # Every field of the service parameter object is an attribute above
+    _field_names = tuple(objects.service_parameter.fields)
+
     def __init__(self, **kwargs):
-        self.fields = objects.service_parameter.fields.keys()
-        for k in self.fields:
-            if not hasattr(self, k):
-                continue
+        for k in self._field_names:
             setattr(self, k, kwargs.get(k, wtypes.Unset))
 
+    def as_dict(self):
+        """Render this object as a dict of its fields."""
+        # The field names are kept on the class rather than in self.fields,
+        # as wsme would treat a public class attribute as an API attribute.
+        return dict((k, getattr(self, k))
+                    for k in self._field_names
+                    if getattr(self, k) != wtypes.Unset)
+
     @classmethod
-    def convert_with_links(cls, rpc_service_parameter, expand=True):
-        parm = ServiceParameter(**rpc_service_parameter.as_dict())
+    def convert_with_links(cls, rpc_service_parameter, expand=True,
+                           host_url=None):
+        parameter = rpc_service_parameter.as_dict()
         if not expand:
-            parm.unset_fields_except(['uuid', 'service', 'section',
-                                      'name', 'value', 'personality', 'resource'])
-
-        parm.links = [link.Link.make_link('self', pecan.request.host_url,
+            # Only set the summary fields, rather than setting every field
+            # and then unsetting the others
+            parameter = dict((k, v) for k, v in parameter.items()
+                             if k in SUMMARY_FIELDS)
+        parm = ServiceParameter(**parameter)
+
+        if host_url is None:
+            host_url = pecan.request.host_url
+        parm.links = [link.Link.make_link('self', host_url,
                                           'parameters', parm.uuid),
                       link.Link.make_link('bookmark',
-                                          pecan.request.host_url,
+                                          host_url,
                                           'parameters', parm.uuid,
                                           bookmark=True)
                       ]
@@ -116,7 +134,9 @@ class ServiceParameterCollection(collection.Collection):
                            expand=False,
                            **kwargs):
         collection = ServiceParameterCollection()
-        collection.parameters = [ServiceParameter.convert_with_links(p, expand)
+        host_url = pecan.request.host_url
+        collection.parameters = [ServiceParameter.convert_with_links(
+                                     p, expand, host_url=host_url)
                                  for p in rpc_service_parameter]
         collection.next = collection.get_next(limit, url=url, **kwargs)
         return collection
@@ -151,37 +171,29 @@ class ServiceParameterController(rest.RestController):
             marker_obj = objects.service_parameter.get_by_uuid(
                 pecan.request.context, marker)
 
+        # filter out desired and applied parameters; they are used to keep
+        # track of updates between two consecutive apply actions
         if q is None:
             parms = pecan.request.dbapi.service_parameter_get_list(
                 limit=limit, marker=marker_obj,
-                sort_key=sort_key, sort_dir=sort_dir)
+                sort_key=sort_key, sort_dir=sort_dir,
+                exclude_service=constants.SERVICE_TYPE_CEPH)
         else:
             kwargs['limit'] = limit
             kwargs['sort_key'] = sort_key
             kwargs['sort_dir'] = sort_dir
+            kwargs['exclude_service'] = constants.SERVICE_TYPE_CEPH
             parms = pecan.request.dbapi.service_parameter_get_all(**kwargs)
 
-        # filter out desired and applied parameters; they are used to keep
-        # track of updates between two consecutive apply actions
-        parms = [p for p in parms if not
-                 p.service == constants.SERVICE_TYPE_CEPH]
-
         # Before we can return the service parameter collection,
         # we need to ensure that the list does not contain any
         # "protected" service parameters which may need to be
         # obfuscated.
-        for idx, svc_param in enumerate(parms):
-            service = svc_param['service']
-            section = svc_param['section']
-            name = svc_param['name']
-
-            if service in service_parameter.SERVICE_PARAMETER_SCHEMA \
-                    and section in service_parameter.SERVICE_PARAMETER_SCHEMA[service]:
-                schema = service_parameter.SERVICE_PARAMETER_SCHEMA[service][section]
-                if service_parameter.SERVICE_PARAM_PROTECTED in schema:
-                    # atleast one parameter is to be protected
-                    if name in schema[service_parameter.SERVICE_PARAM_PROTECTED]:
-                        parms[idx]['value'] = service_parameter.SERVICE_VALUE_PROTECTION_MASK
+        for svc_param in parms:
+            if service_parameter.is_protected(svc_param['service'],
+                                              svc_param['section'],
+                                              svc_param['name']):
+                svc_param['value'] = service_parameter.SERVICE_VALUE_PROTECTION_MASK
 
         return ServiceParameterCollection.convert_with_links(
             parms, limit, url=resource_url, expand=expand,
@@ -189,11 +201,8 @@ class ServiceParameterController(rest.RestController):
 
     def _get_updates(self, patch):
         """Retrieve the updated attributes from the patch request."""
-        updates = {}
-        for p in patch:
-            attribute = p['path'] if p['path'][0] != '/' else p['path'][1:]
-            updates[attribute] = p['value']
-        return updates
+        return dict((p['path'][1:] if p['path'].startswith('/') else p['path'],
+                     p['value']) for p in patch)
 
     @wsme_pecan.wsexpose(ServiceParameterCollection, [Query],
                          types.uuid, wtypes.text,
@@ -217,20 +226,22 @@ class ServiceParameterController(rest.RestController):
         # Before we can return the service parameter, we need
         # to ensure that it is not a "protected" parameter
         # which may need to be obfuscated.
-        service = rpc_parameter['service']
-        section = rpc_parameter['section']
-        name = rpc_parameter['name']
-
-        if service in service_parameter.SERVICE_PARAMETER_SCHEMA \
-                and section in service_parameter.SERVICE_PARAMETER_SCHEMA[service]:
-            schema = service_parameter.SERVICE_PARAMETER_SCHEMA[service][section]
-            if service_parameter.SERVICE_PARAM_PROTECTED in schema:
-                # parameter is to be protected
-                if name in schema[service_parameter.SERVICE_PARAM_PROTECTED]:
-                    rpc_parameter['value'] = service_parameter.SERVICE_VALUE_PROTECTION_MASK
+        if service_parameter.is_protected(rpc_parameter['service'],
+                                          rpc_parameter['section'],
+                                          rpc_parameter['name']):
+            rpc_parameter['value'] = service_parameter.SERVICE_VALUE_PROTECTION_MASK
 
         return ServiceParameter.convert_with_links(rpc_parameter)
 
+    @staticmethod
+    def _check_ceph_backend(service):
+        """Check that the Ceph backend is configured for Ceph parameters"""
+        if service == constants.SERVICE_TYPE_CEPH:
+            if not StorageBackendConfig.has_backend_configured(
+                    pecan.request.dbapi, constants.CINDER_BACKEND_CEPH):
+                msg = _("Ceph backend is required.")
+                raise wsme.exc.ClientSideError(msg)
+
     @staticmethod
     def _check_parameter_syntax(svc_param):
         """Check the attributes of service parameter"""
@@ -240,9 +251,7 @@ class ServiceParameterController(rest.RestController):
         value = svc_param['value']
 
         schema = service_parameter.SERVICE_PARAMETER_SCHEMA[service][section]
-        parameters = (schema.get(service_parameter.SERVICE_PARAM_MANDATORY, []) +
-                      schema.get(service_parameter.SERVICE_PARAM_OPTIONAL, []))
-        if name not in parameters:
+        if name not in service_parameter.get_parameter_names(service, section):
             msg = _("The parameter name %s is invalid for "
                     "service %s section %s"
                     % (name, service, section))
@@ -283,10 +292,7 @@ class ServiceParameterController(rest.RestController):
 
         if service in service_parameter.SERVICE_PARAMETER_SCHEMA \
                 and section in service_parameter.SERVICE_PARAMETER_SCHEMA[service]:
-            schema = service_parameter.SERVICE_PARAMETER_SCHEMA[service][section]
-            parameters = (schema.get(service_parameter.SERVICE_PARAM_MANDATORY, []) +
-                          schema.get(service_parameter.SERVICE_PARAM_OPTIONAL, []))
-            if name in parameters:
+            if name in service_parameter.get_parameter_names(service, section):
                 msg = _("The parameter name %s is reserved for "
                         "service %s section %s, and cannot be customized"
                         % (name, service, section))
@@ -326,11 +332,7 @@ class ServiceParameterController(rest.RestController):
         if not parameters:
             raise wsme.exc.ClientSideError(_("Unspecified parameters."))
 
-        if service == constants.SERVICE_TYPE_CEPH:
-            if not StorageBackendConfig.has_backend_configured(
-                    pecan.request.dbapi, constants.CINDER_BACKEND_CEPH):
-                msg = _("Ceph backend is required.")
-                raise wsme.exc.ClientSideError(msg)
+        self._check_ceph_backend(service)
 
         if len(parameters) > 1:
             msg = _("Cannot specify multiple parameters with custom resource.")
@@ -347,33 +349,24 @@ class ServiceParameterController(rest.RestController):
             }
             self._check_custom_parameter_syntax(new_record)
 
-            existing = False
-            try:
-                pecan.request.dbapi.service_parameter_get_one(
-                    service, section, name,
-                    personality, resource)
-                existing = True
-            except exception.NotFound:
-                pass
-            except exception.MultipleResults:
-                # We'll check/handle this in the "finally" block
-                existing = True
-            finally:
-                if existing:
-                    msg = _("Service parameter add failed: "
-                            "Parameter already exists: "
-                            "service=%s section=%s name=%s "
-                            "personality=%s resource=%s"
-                            % (service, section, name,
-                               personality, resource))
-                    raise wsme.exc.ClientSideError(msg)
+            existing = pecan.request.dbapi.service_parameter_find_one(
+                service, section, name, personality, resource)
+            if existing is not None:
+                msg = _("Service parameter add failed: "
+                        "Parameter already exists: "
+                        "service=%s section=%s name=%s "
+                        "personality=%s resource=%s"
+                        % (service, section, name,
+                           personality, resource))
+                raise wsme.exc.ClientSideError(msg)
 
             new_records.append(new_record)
 
+        dbapi = pecan.request.dbapi
         svc_params = []
         for n in new_records:
             try:
-                new_parm = pecan.request.dbapi.service_parameter_create(n)
+                new_parm = dbapi.service_parameter_create(n)
             except exception.NotFound:
                 msg = _("Service parameter add failed:  "
                         "service %s section %s name %s value %s"
@@ -387,13 +380,13 @@ class ServiceParameterController(rest.RestController):
                 pecan.request.context, service)
         except rpc_common.RemoteError as e:
             # rollback create service parameters
-            for p in svc_params:
-                try:
-                    pecan.request.dbapi.service_parameter_destroy_uuid(p.uuid)
-                    LOG.warn(_("Rollback service parameter create: "
-                               "destroy uuid {}".format(p.uuid)))
-                except exception.SysinvException:
-                    pass
+            uuids = [p.uuid for p in svc_params]
+            try:
+                dbapi.service_parameter_destroy_uuids(uuids)
+                LOG.warn(_("Rollback service parameter create: "
+                           "destroy uuids {}".format(uuids)))
+            except exception.SysinvException:
+                pass
             raise wsme.exc.ClientSideError(str(e.value))
         except Exception as e:
             with excutils.save_and_reraise_exception():
@@ -428,11 +421,13 @@ class ServiceParameterController(rest.RestController):
         if not parameters:
             raise wsme.exc.ClientSideError(_("Unspecified parameters."))
 
-        if service == constants.SERVICE_TYPE_CEPH:
-            if not StorageBackendConfig.has_backend_configured(
-                    pecan.request.dbapi, constants.CINDER_BACKEND_CEPH):
-                msg = _("Ceph backend is required.")
-                raise wsme.exc.ClientSideError(msg)
+        self._check_ceph_backend(service)
+
+        # Get the names of the existing parameters of the section with a
+        # single query, rather than one query per new parameter
+        existing_names = set(
+            p.name for p in pecan.request.dbapi.service_parameter_get_all(
+                service=service, section=section))
 
         for name, value in parameters.items():
             new_record = {
@@ -443,30 +438,20 @@ class ServiceParameterController(rest.RestController):
             }
             self._check_parameter_syntax(new_record)
 
-            existing = False
-            try:
-                pecan.request.dbapi.service_parameter_get_one(
-                    service, section, name)
-                existing = True
-            except exception.NotFound:
-                pass
-            except exception.MultipleResults:
-                # We'll check/handle this in the "finally" block
-                existing = True
-            finally:
-                if existing:
-                    msg = _("Service parameter add failed: "
-                            "Parameter already exists: "
-                            "service=%s section=%s name=%s"
-                            % (service, section, name))
-                    raise wsme.exc.ClientSideError(msg)
+            if name in existing_names:
+                msg = _("Service parameter add failed: "
+                        "Parameter already exists: "
+                        "service=%s section=%s name=%s"
+                        % (service, section, name))
+                raise wsme.exc.ClientSideError(msg)
 
             new_records.append(new_record)
 
+        dbapi = pecan.request.dbapi
         svc_params = []
         for n in new_records:
             try:
-                new_parm = pecan.request.dbapi.service_parameter_create(n)
+                new_parm = dbapi.service_parameter_create(n)
             except exception.NotFound:
                 msg = _("Service parameter add failed:  "
                         "service %s section %s name %s value %s"
@@ -479,13 +464,13 @@ class ServiceParameterController(rest.RestController):
                 pecan.request.context, service)
         except rpc_common.RemoteError as e:
             # rollback create service parameters
-            for p in svc_params:
-                try:
-                    pecan.request.dbapi.service_parameter_destroy_uuid(p.uuid)
-                    LOG.warn(_("Rollback service parameter create: "
-                               "destroy uuid {}".format(p.uuid)))
-                except exception.SysinvException:
-                    pass
+            uuids = [p.uuid for p in svc_params]
+            try:
+                dbapi.service_parameter_destroy_uuids(uuids)
+                LOG.warn(_("Rollback service parameter create: "
+                           "destroy uuids {}".format(uuids)))
+            except exception.SysinvException:
+                pass
             raise wsme.exc.ClientSideError(str(e.value))
         except Exception as e:
             with excutils.save_and_reraise_exception():
@@ -502,7 +487,7 @@ class ServiceParameterController(rest.RestController):
             pecan.request.context, uuid)
 
         parameter = parameter.as_dict()
-        old_parameter = copy.deepcopy(parameter)
+        old_parameter = parameter.copy()
 
         updates = self._get_updates(patch)
         parameter.update(updates)
@@ -537,11 +522,7 @@ class ServiceParameterController(rest.RestController):
 
         parameter = objects.service_parameter.get_by_uuid(
             pecan.request.context, uuid)
-        if parameter.service == constants.SERVICE_TYPE_CEPH:
-            if not StorageBackendConfig.has_backend_configured(
-                    pecan.request.dbapi, constants.CINDER_BACKEND_CEPH):
-                msg = _("Ceph backend is required.")
-                raise wsme.exc.ClientSideError(msg)
+        self._check_ceph_backend(parameter.service)
 
         if parameter.personality is not None or parameter.resource is not None:
             return self.patch_custom_resource(uuid,
@@ -550,7 +531,7 @@ class ServiceParameterController(rest.RestController):
                                               parameter.resource)
 
         parameter = parameter.as_dict()
-        old_parameter = copy.deepcopy(parameter)
+        old_parameter = parameter.copy()
 
         updates = self._get_updates(patch)
         parameter.update(updates)
@@ -577,17 +558,10 @@ class ServiceParameterController(rest.RestController):
         # Before we can return the service parameter, we need
         # to ensure that this updated parameter is not "protected"
         # which may need to be obfuscated.
-        service = updated_parameter['service']
-        section = updated_parameter['section']
-        name = updated_parameter['name']
-
-        if service in service_parameter.SERVICE_PARAMETER_SCHEMA \
-                and section in service_parameter.SERVICE_PARAMETER_SCHEMA[service]:
-            schema = service_parameter.SERVICE_PARAMETER_SCHEMA[service][section]
-            if service_parameter.SERVICE_PARAM_PROTECTED in schema:
-                # parameter is to be protected
-                if name in schema[service_parameter.SERVICE_PARAM_PROTECTED]:
-                    updated_parameter['value'] = service_parameter.SERVICE_VALUE_PROTECTION_MASK
+        if service_parameter.is_protected(updated_parameter['service'],
+                                          updated_parameter['section'],
+                                          updated_parameter['name']):
+            updated_parameter['value'] = service_parameter.SERVICE_VALUE_PROTECTION_MASK
 
         return ServiceParameter.convert_with_links(updated_parameter)
 
@@ -597,11 +571,7 @@ class ServiceParameterController(rest.RestController):
         """Delete a Service Parameter instance."""
         parameter = objects.service_parameter.get_by_uuid(pecan.request.context, uuid)
 
-        if parameter.service == constants.SERVICE_TYPE_CEPH:
-            if not StorageBackendConfig.has_backend_configured(
-                    pecan.request.dbapi, constants.CINDER_BACKEND_CEPH):
-                msg = _("Ceph backend is required.")
-                raise wsme.exc.ClientSideError(msg)
+        self._check_ceph_backend(parameter.service)
 
         if parameter.section == \
                 constants.SERVICE_PARAM_SECTION_PLATFORM_MAINTENANCE:
@@ -627,17 +597,15 @@ class ServiceParameterController(rest.RestController):
             raise wsme.exc.ClientSideError(str(e.value))
 
     @staticmethod
-    def _service_parameter_apply_semantic_check_mtce():
+    def _service_parameter_apply_semantic_check_mtce(parameters):
         """Semantic checks for the Platform Maintenance Service Type """
-        hbs_failure_threshold = pecan.request.dbapi.service_parameter_get_one(
-            service=constants.SERVICE_TYPE_PLATFORM,
-            section=constants.SERVICE_PARAM_SECTION_PLATFORM_MAINTENANCE,
-            name=constants.SERVICE_PARAM_PLAT_MTCE_HBS_FAILURE_THRESHOLD)
+        hbs_failure_threshold = parameters[(
+            constants.SERVICE_PARAM_SECTION_PLATFORM_MAINTENANCE,
+            constants.SERVICE_PARAM_PLAT_MTCE_HBS_FAILURE_THRESHOLD)]
 
-        hbs_degrade_threshold = pecan.request.dbapi.service_parameter_get_one(
-            service=constants.SERVICE_TYPE_PLATFORM,
-            section=constants.SERVICE_PARAM_SECTION_PLATFORM_MAINTENANCE,
-            name=constants.SERVICE_PARAM_PLAT_MTCE_HBS_DEGRADE_THRESHOLD)
+        hbs_degrade_threshold = parameters[(
+            constants.SERVICE_PARAM_SECTION_PLATFORM_MAINTENANCE,
+            constants.SERVICE_PARAM_PLAT_MTCE_HBS_DEGRADE_THRESHOLD)]
 
         if int(hbs_degrade_threshold.value) >= int(hbs_failure_threshold.value):
             msg = _("Unable to apply service parameters. "
@@ -653,9 +621,7 @@ class ServiceParameterController(rest.RestController):
         """Semantic checks for the HTTP Service Type """
 
         # check if a patching operation in progress
-        fm = fm_api.FaultAPIs()
-
-        alarms = fm.get_faults_by_id(fm_constants.
+        alarms = FM.get_faults_by_id(fm_constants.
                                      FM_ALARM_ID_PATCH_IN_PROGRESS)
         if alarms is not None:
             msg = _("Unable to apply %s service parameters. "
@@ -664,31 +630,28 @@ class ServiceParameterController(rest.RestController):
             raise wsme.exc.ClientSideError(msg)
 
         # check if all hosts are unlocked/enabled
-        hosts = pecan.request.dbapi.ihost_get_list()
-        for host in hosts:
-            if (host['administrative'] == constants.ADMIN_UNLOCKED and
-                        host['operational'] == constants.OPERATIONAL_ENABLED):
-                continue
-            else:
-                # the host name might be None for a newly discovered host
-                if not host['hostname']:
-                    host_id = host['uuid']
-                else:
-                    host_id = host['hostname']
-                raise wsme.exc.ClientSideError(
-                    _("Host %s must be unlocked and enabled." % host_id))
+        host = pecan.request.dbapi.ihost_find_not_unlocked_enabled()
+        if host is not None:
+            hostname, host_uuid = host
+            # the host name might be None for a newly discovered host
+            host_id = hostname or host_uuid
+            raise wsme.exc.ClientSideError(
+                _("Host %s must be unlocked and enabled." % host_id))
 
     def _service_parameter_apply_semantic_check(self, service):
         """Semantic checks for the service-parameter-apply command """
 
+        # Get the configured parameters of the service with a single query,
+        # indexed by section and name
+        parameters = dict(((p.section, p.name), p) for p in
+                          pecan.request.dbapi.service_parameter_get_all(
+                              service=service))
+
         # Check if all the mandatory parameters have been configured
         for section, schema in service_parameter.SERVICE_PARAMETER_SCHEMA[service].items():
             mandatory = schema.get(service_parameter.SERVICE_PARAM_MANDATORY, [])
             for name in mandatory:
-                try:
-                    pecan.request.dbapi.service_parameter_get_one(
-                        service=service, section=section, name=name)
-                except exception.NotFound:
+                if (section, name) not in parameters:
                     msg = _("Unable to apply service parameters. "
                             "Missing service parameter '%s' for service '%s' "
                             "in section '%s'." % (name, service, section))
@@ -696,7 +659,7 @@ class ServiceParameterController(rest.RestController):
 
         # Apply service specific semantic checks
         if service == constants.SERVICE_TYPE_PLATFORM:
-            self._service_parameter_apply_semantic_check_mtce()
+            self._service_parameter_apply_semantic_check_mtce(parameters)
 
         if service == constants.SERVICE_TYPE_HTTP:
             self._service_parameter_apply_semantic_check_http()
@@ -711,7 +674,7 @@ class ServiceParameterController(rest.RestController):
         return service
 
     @cutils.synchronized(LOCK_NAME)
-    @wsme_pecan.wsexpose('json', body=six.text_type)
+    @wsme_pecan.wsexpose('json', body=types.apidict)
     def apply(self, body):
         """ Apply the service parameters."""
         service = self._get_service(body)
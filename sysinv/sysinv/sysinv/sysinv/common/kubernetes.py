@@ -280,8 +280,8 @@ class KubeOperator(object):
             c.delete_namespaced_custom_object(group, version, namespace,
                 plural, name, body)
         except ApiException as ex:
-            if ex.reason == "Not Found":
-                pass
+            if ex.reason != "Not Found":
+                raise
         except Exception as e:
             LOG.error("Failed to delete custom object, Namespace %s: %s"
                       % (namespace, e))
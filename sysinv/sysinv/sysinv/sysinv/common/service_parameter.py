@@ -657,3 +657,27 @@ def map_resource(resource_query):
                         }
 
     return MANAGED_RESOURCES_MAP.get(resource_query)
+
+
+PROTECTED_PARAMETERS = frozenset(
+    (service, section, name)
+    for service, sections in SERVICE_PARAMETER_SCHEMA.items()
+    for section, schema in sections.items()
+    for name in schema.get(SERVICE_PARAM_PROTECTED, []))
+
+PARAMETER_NAMES_MAP = dict(
+    ((service, section),
+     frozenset(schema.get(SERVICE_PARAM_MANDATORY, []) +
+               schema.get(SERVICE_PARAM_OPTIONAL, [])))
+    for service, sections in SERVICE_PARAMETER_SCHEMA.items()
+    for section, schema in sections.items())
+
+
+def is_protected(service, section, name):
+    """Return whether a parameter is protected from changes"""
+    return (service, section, name) in PROTECTED_PARAMETERS
+
+
+def get_parameter_names(service, section):
+    """Return the mandatory and optional parameter names of a section"""
+    return PARAMETER_NAMES_MAP.get((service, section), frozenset())
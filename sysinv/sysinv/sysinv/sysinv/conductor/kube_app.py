@@ -21,23 +21,29 @@ import re
 import ruamel.yaml as yaml
 import shutil
 import six
+import stat
 import subprocess
+import tempfile
 import threading
 import time
 
+from collections import defaultdict
 from collections import namedtuple
 from eventlet import greenpool
 from eventlet import greenthread
 from eventlet import queue
 from eventlet import Timeout
+from eventlet import tpool
 from fm_api import constants as fm_constants
 from fm_api import fm_api
+from kubernetes.client.rest import ApiException
 from oslo_config import cfg
 from oslo_log import log as logging
 from sysinv.api.controllers.v1 import kube_app
 from sysinv.common import constants
 from sysinv.common import exception
 from sysinv.common import kubernetes
+from sysinv.common.retrying import retry
 from sysinv.common import utils as cutils
 from sysinv.common.storage_backend_conf import K8RbdProvisioner
 from sysinv.conductor import openstack
@@ -72,7 +78,7 @@ MAX_DOWNLOAD_THREAD = 5
 MAX_DOWNLOAD_ATTEMPTS = 3
 DOWNLOAD_WAIT_BEFORE_RETRY = 30
 TARFILE_DOWNLOAD_CONNECTION_TIMEOUT = 60
-TARFILE_TRANSFER_CHUNK_SIZE = 1024 * 512
+TARFILE_TRANSFER_CHUNK_SIZE = 1024 * 1024
 DOCKER_REGISTRY_USER = 'admin'
 DOCKER_REGISTRY_SERVICE = 'CGCS'
 DOCKER_REGISTRY_SECRET = 'default-registry-key'
@@ -86,6 +92,13 @@ ARMADA_LOCK_NAMESPACE = 'kube-system'
 ARMADA_LOCK_PLURAL = 'locks'
 ARMADA_LOCK_NAME = 'lock'
 
+# Use the libyaml based loader to parse the chart, images and overrides
+# files when ruamel.yaml has been built with it
+YAML_SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Matches image tags that already name a registry with a port
+IMAGE_REGISTRY_PREFIX_RE = re.compile(r'^.+:.+/')
+
 
 # Helper functions
 def generate_armada_manifest_filename(app_name, app_version, manifest_filename):
@@ -106,8 +119,18 @@ def generate_overrides_dir(app_name, app_version):
     return os.path.join(common.HELM_OVERRIDES_PATH, app_name, app_version)
 
 
+@cutils.memoized
+def get_sysinv_uid():
+    return pwd.getpwnam(constants.SYSINV_USERNAME).pw_uid
+
+
+@cutils.memoized
+def get_sysinv_sysadmin_gid():
+    return grp.getgrnam(constants.SYSINV_SYSADMIN_GRPNAME).gr_gid
+
+
 def create_app_path(path):
-    uid = pwd.getpwnam(constants.SYSINV_USERNAME).pw_uid
+    uid = get_sysinv_uid()
     gid = os.getgid()
 
     if not os.path.exists(constants.APP_INSTALL_PATH):
@@ -119,9 +142,8 @@ def create_app_path(path):
 
 
 def get_app_install_root_path_ownership():
-    uid = os.stat(constants.APP_INSTALL_ROOT_PATH).st_uid
-    gid = os.stat(constants.APP_INSTALL_ROOT_PATH).st_gid
-    return (uid, gid)
+    st = os.stat(constants.APP_INSTALL_ROOT_PATH)
+    return (st.st_uid, st.st_gid)
 
 
 def get_local_docker_registry_auth():
@@ -135,6 +157,28 @@ def get_local_docker_registry_auth():
                 password=registry_password)
 
 
+def write_file_atomically(path, data):
+    """ Replace the content of a file with a single write to a temporary
+        file that is then renamed over it, so that the file is never seen
+        partially written.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        # Keep the ownership and mode of the file being replaced
+        if os.path.exists(path):
+            st = os.stat(path)
+            os.chown(temp_path, st.st_uid, st.st_gid)
+            os.chmod(temp_path, stat.S_IMODE(st.st_mode))
+        else:
+            os.chmod(temp_path, 0o644)
+        os.rename(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+
+
 Chart = namedtuple('Chart', 'metadata_name name namespace location release labels sequenced')
 
 
@@ -153,36 +197,46 @@ class AppOperator(object):
         self._kube = kubernetes.KubeOperator(self._dbapi)
         self._utils = kube_app.KubeAppHelper(self._dbapi)
         self._lock = threading.Lock()
+        # The abort flags and the status of each app have their own locks,
+        # so that they are not held up by long operations under self._lock
+        self._abort_lock = threading.Lock()
+        self._app_locks = defaultdict(threading.Lock)
 
         if not os.path.isfile(constants.ANSIBLE_BOOTSTRAP_FLAG):
             self._clear_stuck_applications()
 
-    def _clear_armada_locks(self):
+    # Kubernetes API errors are usually transient, retry them with a short
+    # backoff. A lock that does not exist is not an error.
+    @retry(stop_max_attempt_number=3,
+           wait_exponential_multiplier=100, wait_exponential_max=2000,
+           retry_on_exception=lambda e: isinstance(e, ApiException))
+    def _delete_armada_locks(self):
         lock_name = "{}.{}.{}".format(ARMADA_LOCK_PLURAL,
                                       ARMADA_LOCK_GROUP,
                                       ARMADA_LOCK_NAME)
+        self._kube.delete_custom_resource(ARMADA_LOCK_GROUP,
+                                          ARMADA_LOCK_VERSION,
+                                          ARMADA_LOCK_NAMESPACE,
+                                          ARMADA_LOCK_PLURAL,
+                                          lock_name)
+
+    def _clear_armada_locks(self):
         try:
-            self._kube.delete_custom_resource(ARMADA_LOCK_GROUP,
-                                              ARMADA_LOCK_VERSION,
-                                              ARMADA_LOCK_NAMESPACE,
-                                              ARMADA_LOCK_PLURAL,
-                                              lock_name)
+            self._delete_armada_locks()
         except Exception:
             # Best effort delete
             LOG.warning("Failed to clear Armada locks.")
             pass
 
     def _clear_stuck_applications(self):
-        apps = self._dbapi.kube_app_get_all()
+        apps = self._dbapi.kube_app_get_by_statuses(
+            [constants.APP_UPLOAD_IN_PROGRESS,
+             constants.APP_APPLY_IN_PROGRESS,
+             constants.APP_UPDATE_IN_PROGRESS,
+             constants.APP_RECOVER_IN_PROGRESS,
+             constants.APP_REMOVE_IN_PROGRESS])
         for app in apps:
-            if app.status in [constants.APP_UPLOAD_IN_PROGRESS,
-                              constants.APP_APPLY_IN_PROGRESS,
-                              constants.APP_UPDATE_IN_PROGRESS,
-                              constants.APP_RECOVER_IN_PROGRESS,
-                              constants.APP_REMOVE_IN_PROGRESS]:
-                self._abort_operation(app, app.status, reset_status=True)
-            else:
-                continue
+            self._abort_operation(app, app.status, reset_status=True)
 
         # Delete the Armada locks that might have been acquired previously
         # for a fresh start. This guarantees that a re-apply, re-update or
@@ -245,12 +299,12 @@ class AppOperator(object):
                                      app_alarms[0].entity_instance_id)
 
     def _register_app_abort(self, app_name):
-        with self._lock:
+        with self._abort_lock:
             AppOperator.abort_requested[app_name] = False
         LOG.info("Register the initial abort status of app %s" % app_name)
 
     def _deregister_app_abort(self, app_name):
-        with self._lock:
+        with self._abort_lock:
             try:
                 del AppOperator.abort_requested[app_name]
             except KeyError:
@@ -265,29 +319,35 @@ class AppOperator(object):
             return False
 
     def _set_abort_flag(self, app_name):
-        with self._lock:
+        with self._abort_lock:
             AppOperator.abort_requested[app_name] = True
         LOG.info("Abort set for app %s" % app_name)
 
     def _cleanup(self, app, app_dir=True):
         """" Remove application directories and override files """
+
+        def _rmtree(path):
+            # Remove the tree from a native thread so that other
+            # greenthreads can run while a large tree is removed
+            tpool.execute(shutil.rmtree, path)
+
         try:
             if os.path.exists(app.overrides_dir):
-                shutil.rmtree(app.overrides_dir)
+                _rmtree(app.overrides_dir)
                 if app_dir:
-                    shutil.rmtree(os.path.dirname(
+                    _rmtree(os.path.dirname(
                         app.overrides_dir))
 
             if os.path.exists(app.armada_mfile_dir):
-                shutil.rmtree(app.armada_mfile_dir)
+                _rmtree(app.armada_mfile_dir)
                 if app_dir:
-                    shutil.rmtree(os.path.dirname(
+                    _rmtree(os.path.dirname(
                         app.armada_mfile_dir))
 
             if os.path.exists(app.path):
-                shutil.rmtree(app.path)
+                _rmtree(app.path)
                 if app_dir:
-                    shutil.rmtree(os.path.dirname(
+                    _rmtree(os.path.dirname(
                         app.path))
         except OSError as e:
             LOG.error(e)
@@ -299,7 +359,7 @@ class AppOperator(object):
         if new_status is None:
             new_status = app.status
 
-        with self._lock:
+        with self._app_locks[app.name]:
             app.update_status(new_status, new_progress)
 
     def _abort_operation(self, app, operation,
@@ -464,7 +524,7 @@ class AppOperator(object):
 
             # Temporarily change /scratch group ownership to sys_protected
             os.chown(constants.APP_INSTALL_ROOT_PATH, orig_uid,
-                     grp.getgrnam(constants.SYSINV_SYSADMIN_GRPNAME).gr_gid)
+                     get_sysinv_sysadmin_gid())
 
             # Extract the tarfile as sysinv user
             if not cutils.extract_tarfile(app.path, app.tarfile, demote_user=True):
@@ -508,11 +568,11 @@ class AppOperator(object):
 
         def _parse_charts():
             ids = []
-            image_tags = []
+            image_tags = set()
             for r, f in cutils.get_files_matching(path, 'values.yaml'):
                 with open(os.path.join(r, f), 'r') as value_f:
                     try_image_tag_repo_format = False
-                    y = yaml.safe_load(value_f)
+                    y = yaml.load(value_f, Loader=YAML_SAFE_LOADER)
                     try:
                         ids = y["images"]["tags"].values()
                     except (AttributeError, TypeError, KeyError):
@@ -525,12 +585,12 @@ class AppOperator(object):
                             ids = [y_image_tag]
                         except (AttributeError, TypeError, KeyError):
                             pass
-                image_tags.extend(ids)
+                image_tags.update(ids)
             return image_tags
 
         image_tags = _parse_charts()
 
-        return list(set(image_tags))
+        return sorted(image_tags)
 
     def _get_image_tags_by_charts(self, app_images_file, app_manifest_file, overrides_dir):
         """ Mine the image tags for charts from the images file. Add the
@@ -543,18 +603,24 @@ class AppOperator(object):
             (ie..registry.local:9001/docker.io/mariadb:10.2.13)
         """
 
-        manifest_image_tags_updated = False
-        image_tags = []
+        # Image tags of the manifest charts that need to be written back,
+        # by position of the chart document in the manifest
+        manifest_images_updated = {}
+        image_tags = set()
+        registry_prefix = constants.DOCKER_REGISTRY_SERVER + '/'
 
         if os.path.exists(app_images_file):
             with open(app_images_file, 'r') as f:
-                images_file = yaml.safe_load(f)
+                images_file = yaml.load(f, Loader=YAML_SAFE_LOADER)
 
+        # The manifest is only mined here, so parse it with the safe loader.
+        # It is parsed again with the round trip loader if it needs to be
+        # updated, to preserve its layout and comments.
         if os.path.exists(app_manifest_file):
             with open(app_manifest_file, 'r') as f:
-                charts = list(yaml.load_all(f, Loader=yaml.RoundTripLoader))
+                charts = list(yaml.load_all(f, Loader=YAML_SAFE_LOADER))
 
-        for chart in charts:
+        for idx, chart in enumerate(charts):
             images_charts = {}
             images_overrides = {}
             images_manifest = {}
@@ -562,98 +628,107 @@ class AppOperator(object):
             overrides_image_tags_updated = False
             chart_image_tags_updated = False
 
-            if "armada/Chart/" in chart['schema']:
-                chart_data = chart['data']
-                chart_name = chart_data['chart_name']
-                chart_namespace = chart_data['namespace']
+            if "armada/Chart/" not in chart['schema']:
+                continue
 
-                # Get the image tags by chart from the images file
-                if chart_name in images_file:
-                    images_charts = images_file[chart_name]
+            chart_data = chart['data']
+            chart_name = chart_data['chart_name']
+            chart_namespace = chart_data['namespace']
 
-                # Get the image tags from the overrides file
-                overrides = chart_namespace + '-' + chart_name + '.yaml'
-                app_overrides_file = os.path.join(overrides_dir, overrides)
-                if os.path.exists(app_overrides_file):
-                    try:
-                        with open(app_overrides_file, 'r') as f:
-                            overrides_file = yaml.safe_load(f)
-                            images_overrides = overrides_file['data']['values']['images']['tags']
-                    except (TypeError, KeyError):
-                        pass
-
-                # Get the image tags from the armada manifest file
-                try_image_tag_repo_format = False
+            # Get the image tags by chart from the images file
+            if chart_name in images_file:
+                images_charts = images_file[chart_name]
+
+            # Get the image tags from the overrides file
+            overrides = chart_namespace + '-' + chart_name + '.yaml'
+            app_overrides_file = os.path.join(overrides_dir, overrides)
+            if os.path.exists(app_overrides_file):
                 try:
-                    images_manifest = chart_data['values']['images']['tags']
-                except (TypeError, KeyError, AttributeError):
-                    try_image_tag_repo_format = True
-                    LOG.info("Armada manifest file has no img tags for "
-                             "chart %s" % chart_name)
+                    with open(app_overrides_file, 'r') as f:
+                        overrides_file = yaml.load(f, Loader=YAML_SAFE_LOADER)
+                        images_overrides = overrides_file['data']['values']['images']['tags']
+                except (TypeError, KeyError):
                     pass
 
-                if try_image_tag_repo_format:
-                    try:
-                        y_image = chart_data['values']['image']
-                        y_image_tag = \
-                            y_image['repository'] + ":" + y_image['tag']
-                        images_manifest = {chart_name: y_image_tag}
-                    except (AttributeError, TypeError, KeyError):
-                        pass
-
-                # For the image tags from the chart path which do not exist
-                # in the overrides and manifest file, add to manifest file.
-                # Convert the image tags in the overrides and manifest file
-                # with local docker registry address.
-                # Append the required images to the image_tags list.
-                for key in images_charts:
-                    if key not in images_overrides:
-                        if key not in images_manifest:
-                            images_manifest.update({key: images_charts[key]})
-                        if not re.match(r'^.+:.+/', images_manifest[key]):
-                            images_manifest.update(
-                                {key: '{}/{}'.format(constants.DOCKER_REGISTRY_SERVER,
-                                                     images_manifest[key])})
-                            chart_image_tags_updated = True
-                        image_tags.append(images_manifest[key])
-                    else:
-                        if not re.match(r'^.+:.+/', images_overrides[key]):
-                            images_overrides.update(
-                                {key: '{}/{}'.format(constants.DOCKER_REGISTRY_SERVER,
-                                                     images_overrides[key])})
-                            overrides_image_tags_updated = True
-                        image_tags.append(images_overrides[key])
-
-                if overrides_image_tags_updated:
-                    with open(app_overrides_file, 'w') as f:
-                        try:
-                            overrides_file["data"]["values"]["images"] = {"tags": images_overrides}
-                            yaml.safe_dump(overrides_file, f, default_flow_style=False)
-                            LOG.info("Overrides file %s updated with new image tags" %
-                                     app_overrides_file)
-                        except (TypeError, KeyError):
-                            LOG.error("Overrides file %s fails to update" %
-                                      app_overrides_file)
-
-                if chart_image_tags_updated:
-                    if 'values' in chart_data:
-                        chart_data['values']['images'] = {'tags': images_manifest}
-                    else:
-                        chart_data["values"] = {"images": {"tags": images_manifest}}
-                    manifest_image_tags_updated = True
+            # Get the image tags from the armada manifest file
+            chart_values = chart_data.get('values')
+            try_image_tag_repo_format = False
+            try:
+                images_manifest = chart_values['images']['tags']
+            except (TypeError, KeyError, AttributeError):
+                try_image_tag_repo_format = True
+                LOG.info("Armada manifest file has no img tags for "
+                         "chart %s" % chart_name)
+                pass
 
-        if manifest_image_tags_updated:
-            with open(app_manifest_file, 'w') as f:
+            if try_image_tag_repo_format:
                 try:
-                    yaml.dump_all(charts, f, Dumper=yaml.RoundTripDumper,
-                                  explicit_start=True, default_flow_style=False)
-                    LOG.info("Manifest file %s updated with new image tags" %
-                             app_manifest_file)
-                except Exception as e:
-                    LOG.error("Manifest file %s fails to update with "
-                              "new image tags: %s" % (app_manifest_file, e))
+                    y_image = chart_values['image']
+                    y_image_tag = \
+                        y_image['repository'] + ":" + y_image['tag']
+                    images_manifest = {chart_name: y_image_tag}
+                except (AttributeError, TypeError, KeyError):
+                    pass
 
-        return list(set(image_tags))
+            # For the image tags from the chart path which do not exist
+            # in the overrides and manifest file, add to manifest file.
+            # Convert the image tags in the overrides and manifest file
+            # with local docker registry address.
+            # Append the required images to the image_tags list.
+            for key in images_charts:
+                if key not in images_overrides:
+                    if key not in images_manifest:
+                        images_manifest[key] = images_charts[key]
+                    if not IMAGE_REGISTRY_PREFIX_RE.match(images_manifest[key]):
+                        images_manifest[key] = \
+                            registry_prefix + images_manifest[key]
+                        chart_image_tags_updated = True
+                    image_tags.add(images_manifest[key])
+                else:
+                    if not IMAGE_REGISTRY_PREFIX_RE.match(images_overrides[key]):
+                        images_overrides[key] = \
+                            registry_prefix + images_overrides[key]
+                        overrides_image_tags_updated = True
+                    image_tags.add(images_overrides[key])
+
+            if overrides_image_tags_updated:
+                try:
+                    overrides_file["data"]["values"]["images"] = {"tags": images_overrides}
+                    write_file_atomically(
+                        app_overrides_file,
+                        yaml.safe_dump(overrides_file, default_flow_style=False))
+                    LOG.info("Overrides file %s updated with new image tags" %
+                             app_overrides_file)
+                except (TypeError, KeyError):
+                    LOG.error("Overrides file %s fails to update" %
+                              app_overrides_file)
+
+            if chart_image_tags_updated:
+                manifest_images_updated[idx] = images_manifest
+
+        if manifest_images_updated:
+            with open(app_manifest_file, 'r') as f:
+                charts = list(yaml.load_all(f, Loader=yaml.RoundTripLoader))
+
+            for idx, images_manifest in manifest_images_updated.items():
+                chart_data = charts[idx]['data']
+                if 'values' in chart_data:
+                    chart_data['values']['images'] = {'tags': images_manifest}
+                else:
+                    chart_data["values"] = {"images": {"tags": images_manifest}}
+
+            try:
+                write_file_atomically(
+                    app_manifest_file,
+                    yaml.dump_all(charts, Dumper=yaml.RoundTripDumper,
+                                  explicit_start=True, default_flow_style=False))
+                LOG.info("Manifest file %s updated with new image tags" %
+                         app_manifest_file)
+            except Exception as e:
+                LOG.error("Manifest file %s fails to update with "
+                          "new image tags: %s" % (app_manifest_file, e))
+
+        return sorted(image_tags)
 
     def _register_embedded_images(self, app):
         """
@@ -699,9 +774,17 @@ class AppOperator(object):
                 version=app.version,
                 reason="charts specify no docker images.")
 
-        with open(app.imgfile_abs, 'ab') as f:
-            yaml.safe_dump({"download_images": images_to_download}, f,
-                           default_flow_style=False)
+        # Add the list to the images file, rewriting the file only if the
+        # list differs from the one it already holds
+        images_list = {}
+        if os.path.exists(app.imgfile_abs):
+            images_list = self._retrieve_images_list(app.imgfile_abs) or {}
+        if images_list.get("download_images") != images_to_download:
+            images_list["download_images"] = images_to_download
+            write_file_atomically(
+                app.imgfile_abs,
+                yaml.safe_dump(images_list, explicit_start=True,
+                               default_flow_style=False))
 
     def _save_images_list_by_charts(self, app):
         # Mine the images from values.yaml files in the charts directory.
@@ -715,7 +798,7 @@ class AppOperator(object):
             try_image_tag_repo_format = False
             if os.path.exists(chart_path):
                 with open(chart_path, 'r') as f:
-                    y = yaml.safe_load(f)
+                    y = yaml.load(f, Loader=YAML_SAFE_LOADER)
                     try:
                         images = y["images"]["tags"]
                     except (TypeError, KeyError, AttributeError):
@@ -735,9 +818,10 @@ class AppOperator(object):
             if images:
                 images_by_charts.update({chart.name: images})
 
-        with open(app.imgfile_abs, 'wb') as f:
-            yaml.safe_dump(images_by_charts, f, explicit_start=True,
-                           default_flow_style=False)
+        write_file_atomically(
+            app.imgfile_abs,
+            yaml.safe_dump(images_by_charts, explicit_start=True,
+                           default_flow_style=False))
 
     def _retrieve_images_list(self, app_images_file):
         with open(app_images_file, 'rb') as f:
@@ -758,9 +842,10 @@ class AppOperator(object):
                 app.imgfile_abs, app.armada_mfile_abs, app.overrides_dir)
             if set(saved_download_images_list) != set(images_to_download):
                 saved_images_list.update({"download_images": images_to_download})
-                with open(app.imgfile_abs, 'wb') as f:
-                    yaml.safe_dump(saved_images_list, f, explicit_start=True,
-                                   default_flow_style=False)
+                write_file_atomically(
+                    app.imgfile_abs,
+                    yaml.safe_dump(saved_images_list, explicit_start=True,
+                                   default_flow_style=False))
         else:
             images_to_download = self._retrieve_images_list(
                 app.imgfile_abs).get("download_images")
@@ -773,6 +858,8 @@ class AppOperator(object):
             local_registry_auth = get_local_docker_registry_auth()
             with self._lock:
                 self._docker._retrieve_specified_registries()
+            # All the image downloads share one docker client
+            client = docker.APIClient(timeout=INSTALLATION_TIMEOUT)
         except Exception as e:
             raise exception.KubeAppApplyFailure(
                 name=app.name,
@@ -782,7 +869,8 @@ class AppOperator(object):
             pool = greenpool.GreenPool(size=threads)
             for tag, success in pool.imap(
                     functools.partial(self._docker.download_an_image,
-                                      app.name, local_registry_auth),
+                                      app.name, local_registry_auth,
+                                      client=client),
                     images_to_download):
                 if success:
                     continue
@@ -875,7 +963,7 @@ class AppOperator(object):
         try:
             # Temporarily change /scratch group ownership to sys_protected
             os.chown(constants.APP_INSTALL_ROOT_PATH, orig_uid,
-                     grp.getgrnam(constants.SYSINV_SYSADMIN_GRPNAME).gr_gid)
+                     get_sysinv_sysadmin_gid())
             with open(os.devnull, "w") as fnull:
                 for chart in charts:
                     subprocess.check_call(['helm-upload', helm_repo, chart],
@@ -2157,14 +2245,14 @@ class AppOperator(object):
         app = AppOperator.Application(
             rpc_app,
             rpc_app.get('name') in self._helm.get_helm_applications())
-        with self._lock:
+        with self._app_locks[app.name]:
             return app.update_active(True)
 
     def deactivate(self, rpc_app):
         app = AppOperator.Application(
             rpc_app,
             rpc_app.get('name') in self._helm.get_helm_applications())
-        with self._lock:
+        with self._app_locks[app.name]:
             return app.update_active(False)
 
     def get_appname(self, rpc_app):
@@ -2697,9 +2785,12 @@ class DockerHelper(object):
             # Failed to get a docker client
             LOG.error("Failed to stop Armada service : %s " % e)
 
-    def download_an_image(self, app_name, local_registry_auth, img_tag):
+    def download_an_image(self, app_name, local_registry_auth, img_tag,
+                          client=None):
 
         rc = True
+        if client is None:
+            client = docker.APIClient(timeout=INSTALLATION_TIMEOUT)
 
         start = time.time()
         if img_tag.startswith(constants.DOCKER_REGISTRY_HOST):
@@ -2709,7 +2800,6 @@ class DockerHelper(object):
                     return img_tag, False
 
                 LOG.info("Image %s download started from local registry" % img_tag)
-                client = docker.APIClient(timeout=INSTALLATION_TIMEOUT)
                 client.pull(img_tag, auth_config=local_registry_auth)
             except docker.errors.NotFound:
                 try:
@@ -2741,7 +2831,6 @@ class DockerHelper(object):
         else:
             try:
                 LOG.info("Image %s download started from public/private registry" % img_tag)
-                client = docker.APIClient(timeout=INSTALLATION_TIMEOUT)
                 target_img_tag, registry_auth = self._get_img_tag_with_registry(img_tag)
                 client.pull(target_img_tag, auth_config=registry_auth)
                 client.tag(target_img_tag, img_tag)
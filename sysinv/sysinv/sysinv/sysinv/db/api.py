@@ -42,6 +42,10 @@ IMPL = db_api.DBAPI.from_config(cfg.CONF, backend_mapping=_BACKEND_MAPPING,
                                 lazy=True)
 
 
+# Returned by lookups that find more than one matching entry
+MULTIPLE_RESULTS = object()
+
+
 def get_instance():
     """Return a DB API instance."""
     return IMPL
@@ -202,6 +206,14 @@ class Connection(object):
             parameter.
         """
 
+    @abc.abstractmethod
+    def ihost_find_not_unlocked_enabled(self):
+        """Look for a host that is not unlocked and enabled.
+
+        returns: The (hostname, uuid) of the first such host, or None
+            if every host is unlocked and enabled.
+        """
+
     @abc.abstractmethod
     def ihost_update(self, server, values):
         """Update properties of a server.
@@ -3709,7 +3721,8 @@ class Connection(object):
 
     @abc.abstractmethod
     def service_parameter_get_list(self, limit=None, marker=None,
-                                   sort_key=None, sort_dir=None):
+                                   sort_key=None, sort_dir=None,
+                                   exclude_service=None):
         """Return a list of service_parameter entries.
 
         :param limit: Maximum number of service_parameter entries to return.
@@ -3718,6 +3731,7 @@ class Connection(object):
         :param sort_key: Attribute by which results should be sorted.
         :param sort_dir: direction in which results should be sorted.
                          (asc, desc)
+        :param exclude_service: name of a service whose entries are left out.
         """
 
     @abc.abstractmethod
@@ -3733,6 +3747,22 @@ class Connection(object):
         :returns: A service parameter.
         """
 
+    @abc.abstractmethod
+    def service_parameter_find_one(self, service=None, section=None,
+                                   name=None, personality=None,
+                                   resource=None):
+        """Look up a service parameter without raising when it is absent.
+
+        :param service: name of service.
+        :param section: name of section.
+        :param name: name of parameter.
+        :param personality: personality filter for custom parameter.
+        :param resource: resource for custom parameter.
+        :returns: None if no service parameter matches, the service
+                  parameter if exactly one matches, MULTIPLE_RESULTS
+                  otherwise.
+        """
+
     @abc.abstractmethod
     def service_parameter_update(self, uuid, values):
         """Update properties of a service_parameter.
@@ -3752,6 +3782,13 @@ class Connection(object):
         :param id: The id or uuid of a service_parameter entry.
         """
 
+    @abc.abstractmethod
+    def service_parameter_destroy_uuids(self, uuids):
+        """Destroy several service_parameter entries.
+
+        :param uuids: The uuids of the service_parameter entries.
+        """
+
     @abc.abstractmethod
     def service_parameter_destroy(self, name, service, section):
         """Destroy a service_parameter entry.
@@ -4423,3 +4460,11 @@ class Connection(object):
 
         :param fs_id: The id or uuid of a filesystem.
         """
+
+    @abc.abstractmethod
+    def kube_app_get_by_statuses(self, statuses):
+        """Return the applications in any of the given statuses.
+
+        :param statuses: list of application statuses.
+        :returns: A list of applications.
+        """
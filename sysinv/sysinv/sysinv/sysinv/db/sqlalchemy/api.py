@@ -1305,6 +1305,16 @@ class Connection(api.Connection):
         query = query.filter_by(personality=personality, recordtype="standard")
         return query.count()
 
+    def ihost_find_not_unlocked_enabled(self):
+        query = model_query(models.ihost.hostname, models.ihost.uuid)
+        query = query.filter(models.ihost.recordtype == "standard")
+        query = query.filter(or_(
+            models.ihost.administrative.is_(None),
+            models.ihost.administrative != constants.ADMIN_UNLOCKED,
+            models.ihost.operational.is_(None),
+            models.ihost.operational != constants.OPERATIONAL_ENABLED))
+        return query.order_by(models.ihost.id).first()
+
     @objects.objectify(objects.host)
     def ihost_get_by_function(self, function,
                               limit=None, marker=None,
@@ -6369,9 +6379,9 @@ class Connection(api.Connection):
 
         return result
 
-    @objects.objectify(objects.service_parameter)
-    def service_parameter_get_one(self, service=None, section=None, name=None,
-                                  personality=None, resource=None):
+    def _service_parameter_query(self, service=None, section=None,
+                                 name=None, personality=None,
+                                 resource=None):
         query = model_query(models.ServiceParameter)
         if service is not None:
             query = query.filter_by(service=service)
@@ -6383,7 +6393,13 @@ class Connection(api.Connection):
             query = query.filter_by(personality=personality)
         if resource is not None:
             query = query.filter_by(resource=resource)
+        return query
 
+    @objects.objectify(objects.service_parameter)
+    def service_parameter_get_one(self, service=None, section=None, name=None,
+                                  personality=None, resource=None):
+        query = self._service_parameter_query(service, section, name,
+                                              personality, resource)
         try:
             result = query.one()
         except NoResultFound:
@@ -6393,11 +6409,34 @@ class Connection(api.Connection):
 
         return result
 
+    @objects.objectify(objects.service_parameter)
+    def _service_parameter_find(self, service=None, section=None, name=None,
+                                personality=None, resource=None):
+        query = self._service_parameter_query(service, section, name,
+                                              personality, resource)
+        # Two rows are enough to tell a unique match from a duplicate
+        return query.limit(2).all()
+
+    def service_parameter_find_one(self, service=None, section=None,
+                                   name=None, personality=None,
+                                   resource=None):
+        result = self._service_parameter_find(service, section, name,
+                                              personality, resource)
+        if not result:
+            return None
+        if len(result) > 1:
+            return api.MULTIPLE_RESULTS
+        return result[0]
+
     @objects.objectify(objects.service_parameter)
     def service_parameter_get_list(self, limit=None, marker=None,
-                                   sort_key=None, sort_dir=None):
+                                   sort_key=None, sort_dir=None,
+                                   exclude_service=None):
 
         query = model_query(models.ServiceParameter)
+        if exclude_service is not None:
+            query = query.filter(
+                models.ServiceParameter.service != exclude_service)
 
         return _paginate_query(models.ServiceParameter, limit, marker,
                                sort_key, sort_dir, query)
@@ -6405,12 +6444,16 @@ class Connection(api.Connection):
     @objects.objectify(objects.service_parameter)
     def service_parameter_get_all(self, uuid=None, service=None,
                                   section=None, name=None, limit=None,
-                                  sort_key=None, sort_dir=None):
+                                  sort_key=None, sort_dir=None,
+                                  exclude_service=None):
         query = model_query(models.ServiceParameter, read_deleted="no")
         if uuid is not None:
             query = query.filter_by(uuid=uuid)
         if service is not None:
             query = query.filter_by(service=service)
+        if exclude_service is not None:
+            query = query.filter(
+                models.ServiceParameter.service != exclude_service)
         if section is not None:
             query = query.filter_by(section=section)
         if name is not None:
@@ -6442,6 +6485,14 @@ class Connection(api.Connection):
 
             query.delete()
 
+    def service_parameter_destroy_uuids(self, uuids):
+        if not uuids:
+            return
+        with _session_for_write() as session:
+            query = model_query(models.ServiceParameter, session=session)
+            query = query.filter(models.ServiceParameter.uuid.in_(uuids))
+            query.delete(synchronize_session=False)
+
     def service_parameter_destroy(self, name, service, section):
         if not name or not service or not section:
             raise exception.NotFound()
@@ -7607,6 +7658,12 @@ class Connection(api.Connection):
             models.KubeApp.status != constants.APP_INACTIVE_STATE)
         return query.all()
 
+    @objects.objectify(objects.kube_app)
+    def kube_app_get_by_statuses(self, statuses):
+        query = model_query(models.KubeApp)
+        query = query.filter(models.KubeApp.status.in_(statuses))
+        return query.all()
+
     @objects.objectify(objects.kube_app)
     def kube_app_get(self, name):
         return self._kube_app_get(name)
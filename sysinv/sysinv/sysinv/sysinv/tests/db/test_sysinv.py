@@ -10,6 +10,7 @@
 
 from sysinv.openstack.common import uuidutils
 
+from sysinv import objects
 from sysinv.common import constants
 from sysinv.common import exception
 from sysinv.db import api as dbapi
@@ -101,6 +102,62 @@ class DbNodeTestCase(base.DbTestCase):
         self.assertRaises(exception.ServerNotFound,
                           self.dbapi.ihost_get, n['id'])
 
+    def _create_test_ihost_with_state(self, index, **kwargs):
+        kwargs.setdefault('administrative', constants.ADMIN_UNLOCKED)
+        kwargs.setdefault('operational', constants.OPERATIONAL_ENABLED)
+        return self._create_test_ihost(
+            id=index, uuid=uuidutils.generate_uuid(),
+            hostname='host-%d' % index,
+            mgmt_mac='01:34:67:9A:CD:%02X' % index,
+            mgmt_ip='192.168.24.%d' % index, **kwargs)
+
+    def test_find_not_unlocked_enabled_ihost_none(self):
+        self._create_test_ihost_with_state(1)
+        self._create_test_ihost_with_state(2)
+        self.assertIsNone(self.dbapi.ihost_find_not_unlocked_enabled())
+
+    def test_find_not_unlocked_enabled_ihost_locked(self):
+        self._create_test_ihost_with_state(1)
+        n = self._create_test_ihost_with_state(
+            2, administrative=constants.ADMIN_LOCKED)
+        res = self.dbapi.ihost_find_not_unlocked_enabled()
+        self.assertEqual((n['hostname'], n['uuid']), tuple(res))
+
+    def test_find_not_unlocked_enabled_ihost_disabled(self):
+        self._create_test_ihost_with_state(1)
+        n = self._create_test_ihost_with_state(
+            2, operational=constants.OPERATIONAL_DISABLED)
+        res = self.dbapi.ihost_find_not_unlocked_enabled()
+        self.assertEqual((n['hostname'], n['uuid']), tuple(res))
+
+    def test_find_not_unlocked_enabled_ihost_null_state(self):
+        n = self._create_test_ihost_with_state(1)
+        self.dbapi.ihost_update(n['id'], {'administrative': None})
+        res = self.dbapi.ihost_find_not_unlocked_enabled()
+        self.assertEqual((n['hostname'], n['uuid']), tuple(res))
+
+        self.dbapi.ihost_update(n['id'], {
+            'administrative': constants.ADMIN_UNLOCKED,
+            'operational': None})
+        res = self.dbapi.ihost_find_not_unlocked_enabled()
+        self.assertEqual((n['hostname'], n['uuid']), tuple(res))
+
+    def test_find_not_unlocked_enabled_ihost_first(self):
+        n = self._create_test_ihost_with_state(
+            1, operational=constants.OPERATIONAL_DISABLED)
+        self._create_test_ihost_with_state(
+            2, administrative=constants.ADMIN_LOCKED)
+        res = self.dbapi.ihost_find_not_unlocked_enabled()
+        self.assertEqual((n['hostname'], n['uuid']), tuple(res))
+
+    def test_find_not_unlocked_enabled_ihost_skips_profiles(self):
+        self._create_test_ihost_with_state(1)
+        self._create_test_ihost_with_state(
+            2, recordtype='profile',
+            administrative=constants.ADMIN_LOCKED,
+            operational=constants.OPERATIONAL_DISABLED)
+        self.assertIsNone(self.dbapi.ihost_find_not_unlocked_enabled())
+
     def test_create_cpuToplogy_on_a_server(self):
         n = self._create_test_ihost()
         forihostid = n['id']
@@ -389,3 +446,120 @@ class DbNodeTestCase(base.DbTestCase):
 
         upd = self.dbapi.storage_ceph_update(res['id'], values)
         self.assertEqual(values['services'], upd['services'])
+
+    # Service Parameter
+    def _create_test_service_parameter(self, name, value='test', **kwargs):
+        values = {'service': constants.SERVICE_TYPE_HTTP,
+                  'section': constants.SERVICE_PARAM_SECTION_HTTP_CONFIG,
+                  'name': name,
+                  'value': value}
+        values.update(kwargs)
+        return self.dbapi.service_parameter_create(values)
+
+    def test_service_parameter_find_one_none(self):
+        self._create_test_service_parameter('param1')
+        res = self.dbapi.service_parameter_find_one(
+            constants.SERVICE_TYPE_HTTP,
+            constants.SERVICE_PARAM_SECTION_HTTP_CONFIG, 'param2')
+        self.assertIsNone(res)
+
+    def test_service_parameter_find_one(self):
+        n = self._create_test_service_parameter('param1')
+        self._create_test_service_parameter('param2')
+        res = self.dbapi.service_parameter_find_one(
+            constants.SERVICE_TYPE_HTTP,
+            constants.SERVICE_PARAM_SECTION_HTTP_CONFIG, 'param1')
+        self.assertIsInstance(res, objects.service_parameter)
+        self.assertEqual(n['uuid'], res['uuid'])
+
+        one = self.dbapi.service_parameter_get_one(
+            constants.SERVICE_TYPE_HTTP,
+            constants.SERVICE_PARAM_SECTION_HTTP_CONFIG, 'param1')
+        self.assertEqual(type(one), type(res))
+        self.assertEqual(one.as_dict(), res.as_dict())
+
+    def test_service_parameter_find_one_multiple(self):
+        self._create_test_service_parameter('param1')
+        self._create_test_service_parameter('param2')
+        res = self.dbapi.service_parameter_find_one(
+            constants.SERVICE_TYPE_HTTP,
+            constants.SERVICE_PARAM_SECTION_HTTP_CONFIG)
+        self.assertIs(dbapi.MULTIPLE_RESULTS, res)
+
+    def test_service_parameter_destroy_uuids(self):
+        params = [self._create_test_service_parameter('param%d' % i)
+                  for i in range(3)]
+        self.dbapi.service_parameter_destroy_uuids(
+            [params[0]['uuid'], params[2]['uuid']])
+
+        res = self.dbapi.service_parameter_get_all(
+            service=constants.SERVICE_TYPE_HTTP)
+        self.assertEqual([params[1]['uuid']], [p['uuid'] for p in res])
+
+    def test_service_parameter_destroy_uuids_empty(self):
+        params = [self._create_test_service_parameter('param%d' % i)
+                  for i in range(2)]
+        self.dbapi.service_parameter_destroy_uuids([])
+
+        res = self.dbapi.service_parameter_get_all(
+            service=constants.SERVICE_TYPE_HTTP)
+        self.assertEqual(sorted(p['uuid'] for p in params),
+                         sorted(p['uuid'] for p in res))
+
+    def _create_test_mixed_service_parameters(self):
+        # The Ceph parameters have the lowest ids, so they would fill the
+        # first page unless they are excluded by the query
+        ceph = [self._create_test_service_parameter(
+                    'ceph%d' % i, service=constants.SERVICE_TYPE_CEPH,
+                    section='monitor')
+                for i in range(3)]
+        other = [self._create_test_service_parameter('param%d' % i)
+                 for i in range(3)]
+        return ceph, other
+
+    def test_service_parameter_get_list_exclude_service(self):
+        ceph, other = self._create_test_mixed_service_parameters()
+
+        res = self.dbapi.service_parameter_get_list(
+            exclude_service=constants.SERVICE_TYPE_CEPH)
+        self.assertEqual([p['uuid'] for p in other],
+                         [p['uuid'] for p in res])
+
+        res = self.dbapi.service_parameter_get_list(
+            limit=2, exclude_service=constants.SERVICE_TYPE_CEPH)
+        self.assertEqual([p['uuid'] for p in other[:2]],
+                         [p['uuid'] for p in res])
+
+    def test_service_parameter_get_all_exclude_service(self):
+        ceph, other = self._create_test_mixed_service_parameters()
+
+        res = self.dbapi.service_parameter_get_all(
+            exclude_service=constants.SERVICE_TYPE_CEPH)
+        self.assertEqual([p['uuid'] for p in other],
+                         [p['uuid'] for p in res])
+
+        res = self.dbapi.service_parameter_get_all(
+            limit=2, exclude_service=constants.SERVICE_TYPE_CEPH)
+        self.assertEqual([p['uuid'] for p in other[:2]],
+                         [p['uuid'] for p in res])
+
+    # Kubernetes Application
+    def test_kube_app_get_by_statuses(self):
+        utils.create_test_app(name='app-uploaded',
+                              status=constants.APP_UPLOAD_SUCCESS)
+        utils.create_test_app(name='app-uploading',
+                              status=constants.APP_UPLOAD_IN_PROGRESS)
+        utils.create_test_app(name='app-applying',
+                              status=constants.APP_APPLY_IN_PROGRESS)
+        utils.create_test_app(name='app-applied',
+                              status=constants.APP_APPLY_SUCCESS)
+
+        res = self.dbapi.kube_app_get_by_statuses(
+            [constants.APP_UPLOAD_IN_PROGRESS,
+             constants.APP_APPLY_IN_PROGRESS])
+        self.assertEqual(['app-applying', 'app-uploading'],
+                         sorted(app.name for app in res))
+
+        res = self.dbapi.kube_app_get_by_statuses(
+            [constants.APP_REMOVE_IN_PROGRESS])
+        self.assertEqual([], res)